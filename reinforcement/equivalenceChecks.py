@@ -0,0 +1,618 @@
+# equivalenceChecks.py
+# --------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Fixed-seed checks that the fast data structures and solvers give the same
+answers as the plain versions they stand in for.
+
+  > python equivalenceChecks.py               run every check
+  > python equivalenceChecks.py -c grid.*     run some of them
+  > python equivalenceChecks.py -l            list the checks
+
+Each check is seeded with the same seed, builds the fast and the plain
+version of the same thing from the same inputs, and stops at the first
+difference it finds.  The script exits with status 1 if any check failed.
+"""
+
+import sys
+import random
+import fnmatch
+import optparse
+import pickle
+
+CHECKS = []
+
+def addCheck(name, check):
+    "Registers a check: a function that raises CheckFailure at the first difference"
+    CHECKS.append((name, check))
+
+class CheckFailure(Exception):
+    pass
+
+def expectEqual(what, got, expected):
+    if not got == expected:
+        raise CheckFailure('%s: got %r, expected %r' % (what, got, expected))
+
+def expectSameEntries(what, got, expected):
+    "Compares two dicts an entry at a time, so that a failure names the first entry that differs"
+    for key in sorted(set(got) | set(expected)):
+        expectEqual('%s %r' % (what, key), got.get(key), expected.get(key))
+
+def expectClose(what, got, expected, tolerance):
+    if abs(got - expected) > tolerance:
+        raise CheckFailure('%s: got %r, expected %r (tolerance %g)' % (what, got, expected, tolerance))
+
+def expectRaises(what, exceptionType, function, *args):
+    try:
+        function(*args)
+    except exceptionType:
+        return
+    raise CheckFailure('%s: did not raise %s' % (what, exceptionType.__name__))
+
+#########
+# Grids #
+#########
+
+def compareGrids(what, bitGrid, grid):
+    "Checks that a BitGrid reads the same as a Grid in every way a Grid can be read"
+    width, height = grid.width, grid.height
+    expectEqual(what + ' cells', [[bitGrid[x][y] for y in range(height)] for x in range(width)], grid.data)
+    expectEqual(what + ' isSet', [[bitGrid.isSet(x, y) for y in range(height)] for x in range(width)], grid.data)
+    expectEqual(what + ' count', (bitGrid.count(), bitGrid.count(False)), (grid.count(), grid.count(False)))
+    expectEqual(what + ' asList', (bitGrid.asList(), bitGrid.asList(False)), (grid.asList(), grid.asList(False)))
+    expectEqual(what + ' packBits', bitGrid.packBits(), grid.packBits())
+    expectEqual(what + ' hash', hash(bitGrid), hash(grid))
+    expectEqual(what + ' str', str(bitGrid), str(grid))
+    expectEqual(what + ' == Grid', bitGrid == grid, True)
+    unpickled = pickle.loads(pickle.dumps(bitGrid))
+    expectEqual(what + ' unpickled', [[unpickled[x][y] for y in range(height)] for x in range(width)], grid.data)
+
+def checkBitGrid():
+    """
+    Random writes, including through negative indices, to a Grid and a
+    BitGrid of the same size, with copies taken along the way that must
+    not see later writes.
+    """
+    import game
+    for width, height in [(1, 1), (5, 3), (41, 21), (7, 40)]:
+        what = 'BitGrid %dx%d' % (width, height)
+        grid, bitGrid = game.Grid(width, height), game.BitGrid(width, height)
+        copies = []
+        for step in range(4 * width * height):
+            x, y = random.randrange(-width, width), random.randrange(-height, height)
+            value = random.random() < 0.5
+            grid[x][y] = value
+            bitGrid[x][y] = value
+            if step % 97 == 0: copies.append((bitGrid.copy(), grid.copy()))
+        compareGrids(what, bitGrid, grid)
+        for bitCopy, copy in copies:
+            compareGrids(what + ' copy', bitCopy, copy)
+        expectEqual(what + ' reconstituted', game.reconstituteGrid(grid.packBits()), bitGrid)
+        compareGrids(what + ' full', game.BitGrid(width, height, True), game.Grid(width, height, True))
+
+        column = bitGrid[0]
+        for name, args in [('append', (True,)), ('extend', ([True],)), ('insert', (0, True)),
+                           ('pop', ()), ('remove', (column[0],)), ('reverse', ()), ('sort', ())]:
+            expectRaises(what + ' column.' + name, TypeError, getattr(column, name), *args)
+        expectRaises(what + ' column slice', TypeError, column.__setitem__, slice(0, 1), [True])
+        expectRaises(what + ' column del', TypeError, column.__delitem__, 0)
+
+def checkLayoutGrids():
+    "The walls and food of every layout against Grids read straight from the layout text"
+    import game, layout, os
+    for fileName in sorted(os.listdir('layouts')):
+        if not fileName.endswith('.lay'): continue
+        board = layout.getLayout(fileName[:-len('.lay')])
+        walls, food = game.Grid(board.width, board.height), game.Grid(board.width, board.height)
+        for row, line in enumerate(board.layoutText):
+            for x, char in enumerate(line[:board.width]):
+                y = board.height - 1 - row
+                walls[x][y] = char == '%'
+                food[x][y] = char == '.'
+        compareGrids(fileName + ' walls', board.walls, walls)
+        compareGrids(fileName + ' food', board.food, food)
+
+def plainGrid(bitGrid):
+    "A Grid with the same cells as a BitGrid"
+    import game
+    grid = game.Grid(bitGrid.width, bitGrid.height)
+    for x, y in bitGrid.asList(): grid[x][y] = True
+    return grid
+
+def checkAdjacency():
+    """
+    Actions.getPossibleActions and getLegalNeighbors on the walls of every
+    layout, which go through the AdjacencyTable, against the same calls on
+    a plain Grid of the walls, which look at the neighbouring cells.
+    """
+    import game, layout, os
+    for fileName in sorted(os.listdir('layouts')):
+        if not fileName.endswith('.lay'): continue
+        walls = layout.getLayout(fileName[:-len('.lay')]).walls
+        plainWalls = plainGrid(walls)
+        for x, y in walls.asList(False):
+            what = '%s (%d,%d)' % (fileName, x, y)
+            for direction in [game.Directions.STOP, game.Directions.EAST]:
+                for position in [(x, y), (x + 0.5, y)]:
+                    configuration = game.Configuration(position, direction)
+                    expectEqual(what + ' actions', game.Actions.getPossibleActions(configuration, walls),
+                                game.Actions.getPossibleActions(configuration, plainWalls))
+        for x in range(walls.width):
+            for y in range(walls.height):
+                expectEqual('%s (%d,%d) neighbors' % (fileName, x, y), game.Actions.getLegalNeighbors((x, y), walls),
+                            game.Actions.getLegalNeighbors((x, y), plainWalls))
+
+addCheck('grid.BitGrid', checkBitGrid)
+addCheck('grid.layouts', checkLayoutGrids)
+addCheck('grid.adjacency', checkAdjacency)
+
+###############
+# Game states #
+###############
+
+STATE_LAYOUTS = ['smallClassic', 'capsuleClassic', 'mediumClassic']
+
+def playedStates(layoutName, numStates=300):
+    """
+    Generates the states of random play on a layout, each agent taking a
+    random legal action in turn.  Play starts over when a game ends.  Each
+    state is generated after the one before it has been looked at, so that
+    whatever the checks work out on a state can be carried to the next.
+    """
+    import pacman, layout
+    board = layout.getLayout(layoutName)
+    initial = pacman.GameState()
+    initial.initialize(board, board.getNumGhosts())
+    state = initial
+    agentIndex = 0
+    for step in range(numStates):
+        if state.isWin() or state.isLose():
+            state, agentIndex = initial, 0
+        yield state
+        state = state.generateSuccessor(agentIndex, random.choice(state.getLegalActions(agentIndex)))
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    pacman.GameState.getAndResetExplored()
+
+def agentDetails(agentState):
+    configuration = agentState.configuration
+    return configuration.pos, configuration.direction, agentState.scaredTimer
+
+def checkFingerprint():
+    """
+    The fingerprint kept up to date move by move against one worked out
+    from scratch, and against everything GameStateData.__eq__ compares:
+    states that are equal must share a fingerprint and (on these few
+    states) states that differ must not.
+    """
+    for layoutName in STATE_LAYOUTS:
+        byFingerprint = {}
+        for step, state in enumerate(playedStates(layoutName)):
+            what = '%s state %d' % (layoutName, step)
+            fingerprint = state.data.getFingerprint()
+            fresh = state.data.deepCopy()
+            fresh.agentStatesChanged()
+            expectEqual(what + ' fingerprint from scratch', fingerprint, fresh.getFingerprint())
+            expectEqual(what + ' hash', hash(state), hash(fingerprint))
+            full = (tuple([agentDetails(agentState) for agentState in state.data.agentStates]),
+                    state.data.food.packBits(), tuple(state.data.capsules), state.data.score)
+            expectEqual(what + ' fingerprint of an equal state', byFingerprint.setdefault(fingerprint, full), full)
+        if len(set([full for full in byFingerprint.values()])) != len(byFingerprint):
+            raise CheckFailure('%s: equal states with different fingerprints' % layoutName)
+
+def checkStateKey():
+    """
+    GameStateData.getStateKey against the parts of the state it is meant
+    to pack: Pacman's position, each ghost's position, direction and
+    scared timer, the food and the capsules.  States must share a key
+    exactly when they agree on all of those.
+    """
+    for layoutName in STATE_LAYOUTS:
+        byKey = {}
+        for step, state in enumerate(playedStates(layoutName)):
+            what = '%s state %d' % (layoutName, step)
+            agentStates = state.data.agentStates
+            parts = ((agentStates[0].getPosition(),), tuple([agentDetails(ghost) for ghost in agentStates[1:]]),
+                     state.data.food.packBits(), tuple(sorted(state.data.capsules)))
+            key = state.getStateKey()
+            expectEqual(what + ' key of the same parts', byKey.setdefault(key, parts), parts)
+        if len(set(byKey.values())) != len(byKey):
+            raise CheckFailure('%s: states with the same parts and different keys' % layoutName)
+
+addCheck('state.fingerprint', checkFingerprint)
+addCheck('state.stateKey', checkStateKey)
+
+def checkClosestFood():
+    """
+    featureExtractors.closestFood on the game's food, which looks up the
+    food's DistanceField as it is eaten, against the breadth-first search
+    it does on plain Grids, from Pacman's square and a few others (walls
+    included) in every state.
+    """
+    import featureExtractors
+    for layoutName in STATE_LAYOUTS:
+        for step, state in enumerate(playedStates(layoutName)):
+            food, walls = state.getFood(), state.getWalls()
+            plainFood, plainWalls = plainGrid(food), plainGrid(walls)
+            positions = [state.getPacmanPosition()]
+            positions += [(random.randrange(walls.width), random.randrange(walls.height)) for i in range(5)]
+            for position in positions:
+                expectEqual('%s state %d closestFood%s' % (layoutName, step, position),
+                            featureExtractors.closestFood(position, food, walls),
+                            featureExtractors.closestFood(position, plainFood, plainWalls))
+
+def checkDistanceField():
+    """
+    Distance fields kept up to date as random food is eaten, a few cells
+    at a time and from copies that share the field, against fields
+    computed from scratch; adding food must not leave a stale field.
+    """
+    import game, layout
+    for layoutName in ['mediumClassic', 'originalClassic']:
+        board = layout.getLayout(layoutName)
+        walls = board.walls
+        adjacency = game.Actions.getAdjacency(walls)
+        food = board.food.copy()
+        grids = []
+        while food.count() > 0:
+            # The copy shares the field of the grid it was made from,
+            # which must not see the copy's changes
+            grids.append(food)
+            food = food.copy()
+            for i in range(random.randrange(1, 4)):
+                if food.count() == 0: break
+                x, y = random.choice(food.asList())
+                food[x][y] = False
+            if random.random() < 0.05:
+                x, y = random.choice(walls.asList(False))
+                food[x][y] = True
+            if random.random() < 0.5: continue
+            what = '%s with %d food' % (layoutName, food.count())
+            expectEqual(what + ' distances', list(food.getDistanceField(walls).dist),
+                        list(game.computeDistanceField(food, adjacency).dist))
+        for food in grids:
+            what = '%s with %d food, again' % (layoutName, food.count())
+            expectEqual(what + ' distances', list(food.getDistanceField(walls).dist),
+                        list(game.computeDistanceField(food, adjacency).dist))
+
+addCheck('state.closestFood', checkClosestFood)
+addCheck('grid.distanceField', checkDistanceField)
+
+########
+# MDPs #
+########
+
+def checkedMDPs():
+    """
+    The gridworlds (and a generated one) with and without noise and a
+    living cost, each made afresh.
+    """
+    import gridworld
+    for name in ['BookGrid', 'BridgeGrid', 'CliffGrid', 'CliffGrid2', 'DiscountGrid', 'MazeGrid', 'generated']:
+        for noise, livingReward in [(0.0, 0.0), (0.2, 0.0), (0.2, -0.3)]:
+            if name == 'generated': mdp = gridworld.generateGridworld(12, 8, seed=3)
+            else: mdp = getattr(gridworld, 'get' + name)()
+            mdp.setNoise(noise)
+            mdp.setLivingReward(livingReward)
+            yield '%s noise %g living %g' % (name, noise, livingReward), mdp
+
+def plainQValue(mdp, values, discount, state, action):
+    total = 0.0
+    for nextState, prob in mdp.getTransitionStatesAndProbs(state, action):
+        total += prob * (mdp.getReward(state, action, nextState) + discount * values[nextState])
+    return total
+
+def plainValueIteration(mdp, discount, iterations=None, tolerance=None):
+    """
+    Batch value iteration straight over the MDP's methods, as
+    ValueIterationAgent did before it compiled the MDP: the given number
+    of sweeps, or until no value changes by tolerance or more.
+    """
+    values = dict([(state, 0.0) for state in mdp.getStates()])
+    sweeps = 0
+    while iterations is None or sweeps < iterations:
+        newValues = dict(values)
+        residual = 0.0
+        for state in mdp.getStates():
+            actions = mdp.getPossibleActions(state)
+            if not actions: continue
+            newValues[state] = max([plainQValue(mdp, values, discount, state, action) for action in actions])
+            residual = max(residual, abs(newValues[state] - values[state]))
+        values = newValues
+        sweeps += 1
+        if tolerance is not None and residual < tolerance: break
+    return values
+
+def compareSolution(what, agent, mdp, discount, values, tolerance):
+    """
+    Checks an agent's values against the given ones, and that its policy
+    takes an action whose Q-value under them is the best there is.
+    """
+    for state in mdp.getStates():
+        expectClose('%s value of %s' % (what, state), agent.getValue(state), values[state], tolerance)
+        actions = mdp.getPossibleActions(state)
+        if not actions: continue
+        qValues = dict([(action, plainQValue(mdp, values, discount, state, action)) for action in actions])
+        policy = agent.getPolicy(state)
+        if policy not in qValues:
+            raise CheckFailure('%s policy of %s: %r is not one of %r' % (what, state, policy, actions))
+        expectClose('%s Q-value of the policy %s in %s' % (what, policy, state),
+                    qValues[policy], max(qValues.values()), tolerance)
+
+def checkValueIteration():
+    """
+    ValueIterationAgent, which sweeps over a CompiledMDP, against plain
+    value iteration after the same number of sweeps.
+    """
+    import valueIterationAgents
+    for name, mdp in checkedMDPs():
+        for discount in [0.9, 0.5]:
+            for iterations in [0, 1, 5, 50]:
+                agent = valueIterationAgents.ValueIterationAgent(mdp, discount, iterations)
+                values = plainValueIteration(mdp, discount, iterations)
+                what = '%s discount %g after %d' % (name, discount, iterations)
+                for state in mdp.getStates():
+                    expectClose('%s value of %s' % (what, state), agent.getValue(state), values[state], 1e-9)
+                    for action in mdp.getPossibleActions(state):
+                        expectClose('%s Q-value of %s in %s' % (what, action, state), agent.getQValue(state, action),
+                                    plainQValue(mdp, values, discount, state, action), 1e-9)
+
+def checkSolvers():
+    """
+    Every solver run to convergence, including warm starts after the noise
+    changes, against plain value iteration run until its values stop
+    changing.
+    """
+    import valueIterationAgents as agents
+    discount = 0.9
+    solvers = [('tolerance', lambda mdp: agents.ValueIterationAgent(mdp, discount, 10000, 1e-10)),
+               ('in place', lambda mdp: agents.ValueIterationAgent(mdp, discount, 10000, 1e-10, True)),
+               ('prioritized', lambda mdp: agents.PrioritizedSweepingValueIterationAgent(mdp, discount, None, 1e-10)),
+               ('policy', lambda mdp: agents.PolicyIterationAgent(mdp, discount, 1000)),
+               ('modified policy', lambda mdp: agents.ModifiedPolicyIterationAgent(mdp, discount, 1000, 20, 1e-10))]
+    for name, mdp in checkedMDPs():
+        values = plainValueIteration(mdp, discount, tolerance=1e-12)
+        for solverName, solve in solvers:
+            compareSolution('%s %s' % (name, solverName), solve(mdp), mdp, discount, values, 1e-7)
+
+        following = [('value', agents.ValueIterationAgent(mdp, discount, 10000, 1e-10, followChanges=True)),
+                     ('policy', agents.PolicyIterationAgent(mdp, discount, 1000, followChanges=True))]
+        oldValues = following[0][1].values.copy()
+        mdp.setNoise(0.3 - mdp.noise)
+        values = plainValueIteration(mdp, discount, tolerance=1e-12)
+        for solverName, agent in following:
+            compareSolution('%s %s following a noise change' % (name, solverName), agent, mdp, discount, values, 1e-7)
+        warm = agents.ValueIterationAgent(mdp, discount, 10000, 1e-10, initialValues=oldValues)
+        compareSolution('%s warm-started' % name, warm, mdp, discount, values, 1e-7)
+
+addCheck('mdp.valueIteration', checkValueIteration)
+addCheck('mdp.solvers', checkSolvers)
+
+############
+# Learning #
+############
+
+def runLearner(makeAgent, environmentName, seed, length):
+    """
+    Seeds the generator, lets the agent makeAgent(actionFn) learn for
+    length episodes of BookGrid (with noise) or length steps of the
+    crawler, and returns it with the list of actions it took.
+    """
+    import gridworld, crawler
+    from benchmark import NullCanvas
+    random.seed(seed)
+    taken = []
+    def decide(state):
+        action = agent.getAction(state)
+        taken.append(action)
+        return action
+    if environmentName == 'gridworld':
+        mdp = gridworld.getBookGrid()
+        mdp.setNoise(0.2)
+        environment = gridworld.GridworldEnvironment(mdp)
+        agent = makeAgent(mdp.getPossibleActions)
+        ignore = lambda *args: None
+        for episode in range(length):
+            gridworld.runEpisode(agent, environment, agent.discount, decide, ignore, ignore, ignore, episode)
+    else:
+        environment = crawler.CrawlingRobotEnvironment(crawler.CrawlingRobot(NullCanvas()))
+        agent = makeAgent(environment.getPossibleActions)
+        agent.startEpisode()
+        for step in range(length):
+            state = environment.getCurrentState()
+            action = decide(state)
+            nextState, reward = environment.doAction(action)
+            agent.observeTransition(state, action, nextState, reward)
+    return agent, taken
+
+def tableEntries(agent):
+    "The agent's Q-values, from a QTable or the dict of Counters, as a dict from (state key, action)"
+    entries = {}
+    table = agent.qTable
+    if table is not None:
+        for key, row in table.rows.items():
+            for column, action in enumerate(table.rowActions[row]):
+                entries[key, action] = table.values[table.rowStart[row] + column]
+    else:
+        for key, stateValues in agent.qValues.items():
+            for action, value in stateValues.items():
+                entries[key, action] = value
+    return entries
+
+def checkQTable():
+    """
+    QLearningAgent with its Q-values in a QTable against the dict of
+    Counters, learning from the same seed: they must take the same actions
+    and end up with exactly the same Q-values.
+    """
+    import qlearningAgents
+    for environmentName, length in [('gridworld', 100), ('crawler', 3000)]:
+        seed = random.getrandbits(32)
+        runs = []
+        for arrayTable in [False, True]:
+            makeAgent = lambda actionFn: qlearningAgents.QLearningAgent(actionFn=actionFn, arrayTable=arrayTable,
+                                                                        epsilon=0.3, alpha=0.5, gamma=0.9)
+            runs.append(runLearner(makeAgent, environmentName, seed, length))
+        (dictAgent, dictActions), (arrayAgent, arrayActions) = runs
+        expectEqual(environmentName + ' actions', arrayActions, dictActions)
+        expectSameEntries(environmentName + ' Q-value', tableEntries(arrayAgent), tableEntries(dictAgent))
+
+addCheck('learning.QTable', checkQTable)
+
+def checkReplayBuffer():
+    """
+    ReplayBuffer against plain lists: after more transitions than it holds
+    it must keep the last ones in ring order, its sum tree must add up to
+    the priorities given, and a prioritized draw must pick the same
+    transition as a linear scan of the running totals from the same
+    random number.
+    """
+    import learningAgents
+    for capacity in [1, 5, 64, 100]:
+        buffer = learningAgents.ReplayBuffer(capacity)
+        transitions = [None] * capacity
+        priorities = [0.0] * capacity
+        maxPriority = 1.0
+        for step in range(5 * capacity / 2 + 1):
+            what = 'capacity %d after %d' % (capacity, step + 1)
+            transition = (('state', step), random.choice('nsew'), ('state', step + 1), random.uniform(-1, 1))
+            buffer.add(*transition)
+            transitions[step % capacity] = transition
+            priorities[step % capacity] = maxPriority
+            size = min(step + 1, capacity)
+            expectEqual(what + ' size', buffer.size, size)
+            for i in range(random.randrange(3)):
+                index = random.randrange(size)
+                priorities[index] = random.expovariate(1.0)
+                buffer.setPriority(index, priorities[index])
+                maxPriority = max(maxPriority, priorities[index])
+            expectEqual(what + ' transitions', [buffer.get(index) for index in range(size)], transitions[:size])
+            expectClose(what + ' total priority', buffer.priorityTree[1], sum(priorities), 1e-9)
+            for draw in range(5):
+                generatorState = random.getstate()
+                index = buffer.samplePrioritized()
+                random.setstate(generatorState)
+                target = random.random() * sum(priorities)
+                expected = 0
+                while expected < size - 1 and target >= priorities[expected]:
+                    target -= priorities[expected]
+                    expected += 1
+                expectEqual('%s draw %d' % (what, draw), index, expected)
+
+addCheck('learning.ReplayBuffer', checkReplayBuffer)
+
+def followWithFullTraces(agent):
+    """
+    Makes a reference learn alongside a SarsaLambdaAgent or QLambdaAgent,
+    from the same transitions and the next actions the agent chooses, with
+    a trace kept on every Q-value it has touched and none ever dropped.
+    Returns the reference's Q-values, a dict from (state, action).
+    """
+    import qlearningAgents
+    watkins = isinstance(agent, qlearningAgents.QLambdaAgent)
+    qValues = {}
+    traces = {}
+    agentUpdate, agentStartEpisode = agent.update, agent.startEpisode
+    def startEpisode():
+        agentStartEpisode()
+        traces.clear()
+    def update(state, action, nextState, reward):
+        agentUpdate(state, action, nextState, reward)
+        nextAction = None
+        if agent.plannedKey is not None: nextAction = agent.plannedAction
+        nextValues = [qValues.get((nextState, a), 0.0) for a in agent.getLegalActions(nextState)]
+        maxValue = max(nextValues + [0.0] * (not nextValues))
+        nextValue = 0.0
+        if nextAction is not None: nextValue = qValues.get((nextState, nextAction), 0.0)
+        target = nextValue
+        if watkins: target = maxValue
+        error = reward + agent.discount * target - qValues.get((state, action), 0.0)
+        traces[state, action] = 1.0
+        for entry in traces:
+            qValues[entry] = qValues.get(entry, 0.0) + agent.alpha * error * traces[entry]
+            traces[entry] *= agent.discount * agent.traceDecay
+        if watkins and nextValue != maxValue: traces.clear()
+    agent.update, agent.startEpisode = update, startEpisode
+    return qValues
+
+def checkLambdaAgents():
+    """
+    SarsaLambdaAgent and QLambdaAgent, which keep sparse traces, against
+    a reference with full traces that follows the same run (see
+    followWithFullTraces).  With no threshold for dropping traces the
+    Q-values must come out the same, with either kind of table.
+    """
+    import qlearningAgents
+    for agentClass in [qlearningAgents.SarsaLambdaAgent, qlearningAgents.QLambdaAgent]:
+        for environmentName, length in [('gridworld', 100), ('crawler', 1000)]:
+            for arrayTable in [False, True]:
+                for traceDecay in [0.0, 0.9]:
+                    what = '%s %s arrayTable %s lambda %g' % (agentClass.__name__, environmentName, arrayTable, traceDecay)
+                    reference = []
+                    def makeAgent(actionFn):
+                        agent = agentClass(actionFn=actionFn, arrayTable=arrayTable, traceDecay=traceDecay,
+                                           traceThreshold=0.0, epsilon=0.3, alpha=0.5, gamma=0.9)
+                        reference.append(followWithFullTraces(agent))
+                        return agent
+                    agent, taken = runLearner(makeAgent, environmentName, random.getrandbits(32), length)
+                    entries = tableEntries(agent)
+                    for entry in sorted(set(entries) | set(reference[0])):
+                        expectClose('%s Q-value %r' % (what, entry), entries.get(entry, 0.0),
+                                    reference[0].get(entry, 0.0), 1e-12)
+
+addCheck('learning.lambdaAgents', checkLambdaAgents)
+
+##########
+# Runner #
+##########
+
+def runChecks(patterns=None, seed=0, out=sys.stdout):
+    """
+    Runs the registered checks whose names match one of the (fnmatch)
+    patterns, or all of them, and returns the names of those that failed.
+    """
+    failed = []
+    for name, check in CHECKS:
+        if patterns and not [p for p in patterns if fnmatch.fnmatch(name, p)]: continue
+        random.seed(seed)
+        try:
+            check()
+            result = 'ok'
+        except CheckFailure, e:
+            failed.append(name)
+            result = 'FAILED  ' + str(e)
+        out.write('%-40s %s\n' % (name, result))
+        out.flush()
+    return failed
+
+def readOptions(argv):
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('-c', '--checks', dest='checks', default=None,
+                      help='Comma separated names or patterns of the checks to run (default: all)')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='Random seed (default %default)')
+    parser.add_option('-l', '--list', action='store_true', dest='list', default=False,
+                      help='List the checks and exit')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readOptions(sys.argv[1:])
+    if options.list:
+        for name, check in CHECKS: print name
+        sys.exit(0)
+    patterns = None
+    if options.checks: patterns = options.checks.split(',')
+    if runChecks(patterns, options.seed): sys.exit(1)
@@ -14,10 +14,64 @@
 
 "Feature extractors for Pacman game states"
 
-from game import Directions, Actions
+from game import Directions, Actions, BitGrid
+from collections import deque
+from array import array
 import util
 
+class FeatureRegistry:
+    """
+    Numbers the features of an extractor with a fixed set of them, so
+    that their values (and the weights on them) can be kept in a flat
+    array of floats indexed by feature rather than in a Counter keyed by
+    feature name.
+
+    A feature the registry has not seen yet is numbered after the others,
+    so arrays made before it was added are shorter than later ones and
+    their missing entries stand for zeros.
+    """
+    def __init__(self, names=()):
+        self.indices = {}
+        self.names = []
+        for name in names:
+            self.getIndex(name)
+
+    def getIndex(self, name):
+        "Returns the index of the named feature, giving it the next one if it has none yet"
+        index = self.indices.get(name)
+        if index is None:
+            index = self.indices[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def newVector(self):
+        "Returns an array of zeros with one entry per feature"
+        return array('d', [0.0]) * len(self.names)
+
+    def toVector(self, features):
+        "Returns the array for a Counter of features"
+        # Number any new features before sizing the array
+        indexed = [(self.getIndex(name), value) for name, value in features.items()]
+        vector = self.newVector()
+        for index, value in indexed:
+            vector[index] = value
+        return vector
+
+    def toCounter(self, vector, keepZeros=False):
+        "Returns the Counter of the nonzero (or, with keepZeros, all) entries of an array of features"
+        features = util.Counter()
+        for index, value in enumerate(vector):
+            if value or keepZeros: features[self.names[index]] = value
+        return features
+
 class FeatureExtractor:
+    # Extractors with a fixed set of features list them in a FeatureRegistry
+    # and can give their features as arrays indexed by it
+    registry = None
+
     def getFeatures(self, state, action):
         """
           Returns a dict from features to counts
@@ -26,6 +80,26 @@ class FeatureExtractor:
         """
         util.raiseNotDefined()
 
+    def getFeaturesForAllActions(self, state, actions=None):
+        """
+          Returns a dict from each of the given actions (by default
+          the legal actions of the game state) to its features, the
+          same as getFeatures would give.  Extractors that look at the
+          whole state override this to do that work once per state
+          rather than once per action.
+        """
+        if actions is None: actions = state.getLegalActions()
+        return dict([(action, self.getFeatures(state, action)) for action in actions])
+
+    def getFeatureVector(self, state, action):
+        "Returns the features as an array indexed by the extractor's registry"
+        return self.registry.toVector(self.getFeatures(state, action))
+
+    def getFeatureVectorsForAllActions(self, state, actions=None):
+        "Returns getFeaturesForAllActions with each action's features as an array"
+        allFeatures = self.getFeaturesForAllActions(state, actions)
+        return dict([(action, self.registry.toVector(features)) for action, features in allFeatures.items()])
+
 class IdentityExtractor(FeatureExtractor):
     def getFeatures(self, state, action):
         """
@@ -56,25 +130,36 @@ def closestFood(pos, food, walls):
     """
     closestFood -- this is similar to the function that we have
     worked on in the search project; here it's all in one place
+
+    For the game's own food grid (a BitGrid) this is a lookup in the grid's
+    distance field, which follows the food as it is eaten; other grids,
+    such as a list of lists of capsules, get a breadth-first search.
     """
-    fringe = [(pos[0], pos[1], 0)]
-    expanded = set()
+    if isinstance(food, BitGrid) and isinstance(walls, BitGrid):
+        x, y = pos
+        if 0 <= x < walls.width and 0 <= y < walls.height:
+            if food.isSet(x, y): return 0
+            return food.getDistanceField(walls).getDistance(x * walls.height + y)
+
+    fringe = deque([(pos[0], pos[1], 0)])
+    expanded = set([(pos[0], pos[1])])
     while fringe:
-        pos_x, pos_y, dist = fringe.pop(0)
-        if (pos_x, pos_y) in expanded:
-            continue
-        expanded.add((pos_x, pos_y))
+        pos_x, pos_y, dist = fringe.popleft()
         # if we find a food at this location then exit
         if food[pos_x][pos_y]:
             return dist
         # otherwise spread out from the location to its neighbours
         nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls)
-        for nbr_x, nbr_y in nbrs:
-            fringe.append((nbr_x, nbr_y, dist+1))
+        for nbr in nbrs:
+            if nbr not in expanded:
+                expanded.add(nbr)
+                fringe.append((nbr[0], nbr[1], dist+1))
     # no food found
     return None
 
 class SimpleExtractor(FeatureExtractor):
+    registry = FeatureRegistry(["bias", "#-of-ghosts-1-step-away", "eats-food", "closest-food"])
+
     def getFeatures(self, state, action):
         """
         Returns simple features for a basic reflex Pacman:
@@ -83,36 +168,72 @@ class SimpleExtractor(FeatureExtractor):
         - whether a ghost collision is imminent
         - whether a ghost is one step away
         """
+        return self.registry.toCounter(self.getFeatureVector(state, action), keepZeros=True)
+
+    def getFeaturesForAllActions(self, state, actions=None):
+        vectors = self.getFeatureVectorsForAllActions(state, actions)
+        return dict([(action, self.registry.toCounter(vector, keepZeros=True)) for action, vector in vectors.items()])
+
+    def getFeatureVector(self, state, action):
+        return self._featureVector(self._stateInfo(state), action)
+
+    def getFeatureVectorsForAllActions(self, state, actions=None):
+        if actions is None: actions = state.getLegalActions()
+        info = self._stateInfo(state)
+        return dict([(action, self._featureVector(info, action)) for action in actions])
+
+    def _stateInfo(self, state):
+        """
+        The parts of the features that depend only on the state: the food
+        and wall grids, pacman's position and, for every square, the number
+        of ghosts one step away from it.
+        """
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
         ghosts = state.getGhostPositions()
 
-        features = util.Counter()
+        ghostNeighbors = util.Counter()
+        for g in ghosts:
+            for neighbor in Actions.getLegalNeighbors(g, walls):
+                ghostNeighbors[neighbor] += 1
+
+        return {'food': food, 'walls': walls, 'position': state.getPacmanPosition(),
+                'ghostNeighbors': ghostNeighbors}
+
+    def _featureVector(self, info, action):
+        food, walls = info['food'], info['walls']
+        index = self.registry.indices
+
+        features = self.registry.newVector()
 
-        features["bias"] = 1.0
+        features[index["bias"]] = 1.0
 
         # compute the location of pacman after he takes the action
-        x, y = state.getPacmanPosition()
+        x, y = info['position']
         dx, dy = Actions.directionToVector(action)
         next_x, next_y = int(x + dx), int(y + dy)
 
         # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
+        features[index["#-of-ghosts-1-step-away"]] = info['ghostNeighbors'][(next_x, next_y)]
 
         # if there is no danger of ghosts then add the food feature
-        if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
-            features["eats-food"] = 1.0
+        if not features[index["#-of-ghosts-1-step-away"]] and food[next_x][next_y]:
+            features[index["eats-food"]] = 1.0
 
         dist = closestFood((next_x, next_y), food, walls)
         if dist is not None:
             # make the distance a number less than one otherwise the update
             # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
-        features.divideAll(10.0)
+            features[index["closest-food"]] = float(dist) / (walls.width * walls.height)
+        for i in range(len(features)):
+            features[i] /= 10.0
         return features
 
-class AdvancedFeatureExtractor(FeatureExtractor):
+class AdvancedFeatureExtractor(SimpleExtractor):
+    registry = FeatureRegistry(["bias", "#-of-ghosts-1-step-away", "eats-food", "closest-food",
+                                "ghost-scared", "closest-capsule"])
+
     def getFeatures(self, state, action):
         """
         Returns simple features for a basic reflex Pacman:
@@ -132,60 +253,69 @@ class AdvancedFeatureExtractor(FeatureExtractor):
         'closest-capsule': -2.040094126821756, // the closer the closest capsule is, the better
         'eats-food': 59.134306789728555} // we should eat food essentially
         """
+        return self.registry.toCounter(self.getFeatureVector(state, action), keepZeros=True)
 
-        # extract the grid of food and wall locations and get the ghost locations
-        food = state.getFood()
-        walls = state.getWalls()
-        ghosts = state.getGhostPositions()
+    def _stateInfo(self, state):
+        info = SimpleExtractor._stateInfo(self, state)
+        walls = info['walls']
 
-        features = util.Counter()
+        '''
+        compute how scared the ghost is, with the magnitude of current min scaredTime for the ghosts
+        divided by the initial scare Time (this distinction is necessary because it is
+        possible that pacman eats a ghost whose scare time will be reset to 0)
+        '''
+
+        from pacman import SCARED_TIME
+        scaredTimers = [ghost.scaredTimer for ghost in state.getGhostStates()]
+        info['ghostScared'] = float(min(scaredTimers))/SCARED_TIME
+
+        capsules = state.getCapsules()
+        # We looked up the implementation of Grid object in game.py to decide how the coordinates are encoded
+        info['capsulesMatrix'] = [[(x, y) in capsules for y in xrange(walls.height)] for x in xrange(walls.width)]
+        return info
+
+    def _featureVector(self, info, action):
+        food, walls = info['food'], info['walls']
+        index = self.registry.indices
+
+        features = self.registry.newVector()
 
-        features["bias"] = 1.0
+        features[index["bias"]] = 1.0
 
         # compute the location of pacman after he takes the action
-        x, y = state.getPacmanPosition()
+        x, y = info['position']
         dx, dy = Actions.directionToVector(action)
         next_x, next_y = int(x + dx), int(y + dy)
 
         # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
+        features[index["#-of-ghosts-1-step-away"]] = info['ghostNeighbors'][(next_x, next_y)]
 
         # if there is no danger of ghosts then add the food feature
-        if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
-            features["eats-food"] = 1.0
+        if not features[index["#-of-ghosts-1-step-away"]] and food[next_x][next_y]:
+            features[index["eats-food"]] = 1.0
 
         dist = closestFood((next_x, next_y), food, walls)
         if dist is not None:
             # make the distance a number less than one otherwise the update
             # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
+            features[index["closest-food"]] = float(dist) / (walls.width * walls.height)
 
-        '''
-        compute how scared the ghost is, with the magnitude of current min scaredTime for the ghosts
-        divided by the initial scare Time (this distinction is necessary because it is
-        possible that pacman eats a ghost whose scare time will be reset to 0)
-        '''
-
-        from pacman import SCARED_TIME
-        scaredTimers = [ghost.scaredTimer for ghost in state.getGhostStates()]
-        features["ghost-scared"] = float(min(scaredTimers))/SCARED_TIME
-        if features["ghost-scared"] > 0.05:
-            features["eats-food"] = 5.0
+        features[index["ghost-scared"]] = info['ghostScared']
+        if features[index["ghost-scared"]] > 0.05:
+            features[index["eats-food"]] = 5.0
             if dist is not None:
-                features["closest-food"] = 5 * float(dist) / (walls.width * walls.height)
-            features["#-of-ghosts-1-step-away"] = 0.
+                features[index["closest-food"]] = 5 * float(dist) / (walls.width * walls.height)
+            features[index["#-of-ghosts-1-step-away"]] = 0.
 
         '''
         compute the distance of the closest capsule, and we care about it because we now have the
         feature of ghost-scared, and we would prefer eating a capsule if possible.
         The magnitude is the actual min distance to the closest capsule (and will be normalized later)
         '''
-        capsules = state.getCapsules()
-        # We looked up the implementation of Grid object in game.py to decide how the coordinates are encoded
-        capsulesMatrix = [[(x, y) in capsules for y in xrange(walls.height)] for x in xrange(walls.width)]
-        dist = closestFood((next_x, next_y), capsulesMatrix, walls)
-        if dist is not None and features["eats-food"]:
-            features["closest-capsule"] = float(dist) / (walls.width * walls.height)
+        dist = closestFood((next_x, next_y), info['capsulesMatrix'], walls)
+        if dist is not None and features[index["eats-food"]]:
+            features[index["closest-capsule"]] = float(dist) / (walls.width * walls.height)
 
-        features.divideAll(10.0)
-        return features
\ No newline at end of file
+        for i in range(len(features)):
+            features[i] /= 10.0
+        return features
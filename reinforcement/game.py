@@ -22,8 +22,12 @@
 
 from util import *
 import time, os
+import random
 import traceback
 import sys
+import heapq
+from array import array
+from collections import deque
 
 #######################
 # Parts worth reading #
@@ -190,6 +194,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if isinstance(other, BitGrid): return other == self
         return self.data == other.data
 
     def __hash__(self):
@@ -274,11 +279,221 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid(Grid):
+    """
+    A Grid of booleans packed into a single integer: cell (x,y) is bit
+    x * height + y, the same cell order packBits uses.  Cells are still read
+    and written as grid[x][y], but the number of set cells is kept up to
+    date on every write, the hash is cached until the next write and copies
+    share the (immutable) integer, so count, hash and copy cost the same on
+    any size of board.  A BitGrid of walls also keeps the AdjacencyTable
+    built from it (see Actions.getAdjacency) until its next write, and a
+    BitGrid of food keeps its DistanceField (see getDistanceField), which
+    is brought up to date for the cells cleared since it was last asked
+    for rather than thrown away.
+
+    Single cells cost more than on a Grid: a read goes through the cached
+    column (about 1.5 times a Grid read) and a write keeps the count, hash
+    and caches up to date (about 5 times).  The layout's walls and food are
+    BitGrids.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self.bits = 0
+        self.numSet = 0
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+            self.numSet = width * height
+        self._hash = None
+        self._adjacency = None
+        self._distanceField = None
+        self._clearedCells = ()
+        self._columns = None
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __getitem__(self, i):
+        # The columns are made on first use and kept until the grid is
+        # copied, so that reading grid[x][y] is two list lookups
+        columns = self._columns
+        if columns is None: columns = self._columns = [None] * self.width
+        column = columns[i]
+        if column is None:
+            column = columns[i] = BitGridColumn(self, i % self.width)
+        return column
+
+    def __setitem__(self, key, item):
+        column = self[key]
+        for y in range(self.height):
+            column[y] = item[y]
+
+    def isSet(self, x, y):
+        "Same as grid[x][y] for an (x,y) known to be on the board, without the bounds checks"
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def setCell(self, index, value):
+        "Sets the cell with the given bit index, keeping the count and hash up to date"
+        mask = 1 << index
+        if value:
+            if self.bits & mask: return
+            self.bits |= mask
+            self.numSet += 1
+            self._distanceField = None
+            self._clearedCells = ()
+        else:
+            if not self.bits & mask: return
+            self.bits ^= mask
+            self.numSet -= 1
+            if self._distanceField is not None:
+                # Applied to the field when it is next asked for
+                self._clearedCells += (index,)
+        self._hash = None
+        self._adjacency = None
+        if self._columns is not None:
+            column = self._columns[index // self.height]
+            if column is not None: list.__setitem__(column, index % self.height, bool(value))
+
+    def getDistanceField(self, walls):
+        """
+        Returns the DistanceField from every cell of the board to the
+        nearest set cell of this grid, moving between cells that aren't
+        walls.  It is computed on first use and shared with copies.
+        """
+        adjacency = Actions.getAdjacency(walls)
+        field = self._distanceField
+        if field is not None and self._clearedCells:
+            for index in self._clearedCells:
+                field = field.without(index)
+            self._distanceField = field
+            self._clearedCells = ()
+        if field is None or field.adjacency is not adjacency:
+            field = self._distanceField = computeDistanceField(self, adjacency)
+        return field
+
+    def __str__(self):
+        out = [[str(self.isSet(x, y))[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.width == other.width and self.height == other.height
+        return [[self.isSet(x, y) for y in range(self.height)] for x in range(self.width)] == other.data
+
+    def __hash__(self):
+        # Same value as Grid.__hash__ for the same cells
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        g.numSet = self.numSet
+        g._hash = self._hash
+        g._adjacency = self._adjacency
+        g._distanceField = self._distanceField
+        g._clearedCells = self._clearedCells
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def __getstate__(self):
+        # Pickles leave out the columns, adjacency table and distance field,
+        # which are all rebuilt on first use
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        state['_adjacency'] = None
+        state['_distanceField'] = None
+        state['_clearedCells'] = ()
+        return state
+
+    def count(self, item =True ):
+        if item: return self.numSet
+        return self.width * self.height - self.numSet
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
+        list = []
+        while bits:
+            lowest = bits & -bits
+            list.append(self._cellIndexToPosition(lowest.bit_length() - 1))
+            bits ^= lowest
+        return list
+
+    def packBits(self):
+        """
+        Returns the same (width, height, bitPackedInts...) representation
+        as Grid.packBits
+        """
+        bits = [self.width, self.height]
+        numCells = self.width * self.height
+        for start in range(0, numCells + 1, self.CELLS_PER_INT):
+            chunk = (self.bits >> start) & ((1 << self.CELLS_PER_INT) - 1)
+            currentInt = 0
+            while chunk:
+                lowest = chunk & -chunk
+                currentInt += 2 ** (self.CELLS_PER_INT - lowest.bit_length())
+                chunk ^= lowest
+            bits.append(currentInt)
+        return tuple(bits)
+
+    def _unpackBits(self, bits):
+        numCells = self.width * self.height
+        for chunkIndex, packed in enumerate(bits):
+            if packed < 0: raise ValueError, "must be a positive integer"
+            start = chunkIndex * self.CELLS_PER_INT
+            while packed:
+                lowest = packed & -packed
+                cell = start + self.CELLS_PER_INT - lowest.bit_length()
+                if cell < numCells: self.setCell(cell, True)
+                packed ^= lowest
+
+class BitGridColumn(list):
+    """
+    The column x of a BitGrid, so that grid[x][y] reads and writes a
+    single bit.  The column is a list of the column's cells, so reading one
+    is a plain list lookup; writes go through to the grid, which keeps the
+    lists it has handed out up to date (see BitGrid.setCell).  Writes of
+    single cells are the only changes a column allows.
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+        bits = (grid.bits >> self.offset) & ((1 << grid.height) - 1)
+        list.__init__(self, [(bits >> y) & 1 == 1 for y in range(grid.height)])
+
+    def __setitem__(self, y, value):
+        if isinstance(y, slice): self._fixedLength()
+        height = len(self)
+        if y < 0: y += height
+        if y < 0 or y >= height: raise IndexError('grid index out of range')
+        self.grid.setCell(self.offset + y, value)
+
+    def _fixedLength(self, *args):
+        raise TypeError('the columns of a BitGrid can only be changed a cell at a time')
+
+    # Anything else that would change the list would leave it out of step
+    # with the grid's bits
+    __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _fixedLength
+    append = extend = insert = pop = remove = reverse = sort = _fixedLength
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
     width, height = bitRep[:2]
-    return Grid(width, height, bitRepresentation= bitRep[2:])
+    return BitGrid(width, height, bitRepresentation= bitRep[2:])
 
 ####################################
 # Parts you shouldn't have to read #
@@ -329,6 +544,18 @@ class Actions:
         return (dx * speed, dy * speed)
     directionToVector = staticmethod(directionToVector)
 
+    def getAdjacency(walls):
+        """
+        Returns the AdjacencyTable of a BitGrid of walls, building it the
+        first time it is asked for, or None for walls of any other kind.
+        """
+        if not isinstance(walls, BitGrid): return None
+        table = walls._adjacency
+        if table is None:
+            table = walls._adjacency = AdjacencyTable(walls)
+        return table
+    getAdjacency = staticmethod(getAdjacency)
+
     def getPossibleActions(config, walls):
         possible = []
         x, y = config.pos
@@ -338,6 +565,11 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
+        table = Actions.getAdjacency(walls)
+        if table is not None:
+            actions = table.getActions(x_int, y_int)
+            if actions is not None: return list(actions)
+
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
             next_y = y_int + dy
@@ -351,6 +583,11 @@ class Actions:
     def getLegalNeighbors(position, walls):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
+        table = Actions.getAdjacency(walls)
+        if table is not None:
+            neighbors = table.getNeighbors(x_int, y_int)
+            if neighbors is not None: return list(neighbors)
+
         neighbors = []
         for dir, vec in Actions._directionsAsList:
             dx, dy = vec
@@ -368,6 +605,160 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+class AdjacencyTable:
+    """
+    The moves out of every cell of a walls grid, worked out once per layout
+    so that Actions.getPossibleActions and Actions.getLegalNeighbors are a
+    single lookup.  Cell (x,y) has index x * height + y, as in BitGrid, and
+    for each cell the table holds
+
+      actions[cell]:       the legal directions, in Actions._directionsAsList order
+      neighbors[cell]:     the (x,y) positions reachable in one step
+      neighborCells[cell]: the cell indices of those positions
+
+    Cells on the edge of the board, where the general code would look off
+    the grid, have None for their actions and are left to that code.
+    """
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        self.wallBits = walls.bits
+        self.actions = []
+        self.neighbors = []
+        self.neighborCells = []
+        for x in range(self.width):
+            for y in range(self.height):
+                actions = []
+                neighbors = []
+                for dir, vec in Actions._directionsAsList:
+                    dx, dy = vec
+                    next_x, next_y = x + dx, y + dy
+                    if next_x < 0 or next_x == self.width or next_y < 0 or next_y == self.height:
+                        actions = None
+                        continue
+                    if walls[next_x][next_y]: continue
+                    if actions is not None: actions.append(dir)
+                    neighbors.append((next_x, next_y))
+                self.actions.append(actions)
+                self.neighbors.append(neighbors)
+                self.neighborCells.append([nx * self.height + ny for nx, ny in neighbors])
+
+    def getActions(self, x, y):
+        "The legal directions out of (x,y), or None if the table can't tell"
+        if x < 0 or x >= self.width or y < 0 or y >= self.height: return None
+        return self.actions[x * self.height + y]
+
+    def getNeighbors(self, x, y):
+        "The positions next to (x,y) that aren't walls, or None if (x,y) is off the board"
+        if x < 0 or x >= self.width or y < 0 or y >= self.height: return None
+        return self.neighbors[x * self.height + y]
+
+class DistanceField:
+    """
+    The maze distance from every cell of a board to the nearest set cell of
+    a BitGrid (usually the food), with the cell that is nearest:
+
+      dist[cell]:  the number of steps, or numCells if none can be reached
+      owner[cell]: the index of the nearest set cell, or -1
+
+    Fields are never changed once built; without(cell) returns the field
+    for the grid with one cell cleared, redoing only the cells that cell
+    was nearest to.
+    """
+    def __init__(self, adjacency, dist, owner):
+        self.adjacency = adjacency
+        self.dist = dist
+        self.owner = owner
+        self.numCells = len(dist)
+
+    def getDistance(self, cell):
+        """
+        Returns the distance from the given cell to the nearest set cell, or
+        None if there is none it can reach.  A wall is one step further
+        than the nearest open cell next to it.
+        """
+        dist = self.dist[cell]
+        if dist == self.numCells and (self.adjacency.wallBits >> cell) & 1:
+            dist = min([self.dist[n] for n in self.adjacency.neighborCells[cell]] + [dist - 1]) + 1
+        if dist == self.numCells: return None
+        return dist
+
+    def without(self, removed):
+        if self.owner[removed] != removed: return self
+        neighborCells = self.adjacency.neighborCells
+        dist = array('l', self.dist)
+        owner = array('l', self.owner)
+
+        # The cells nearest to the removed one form a connected region
+        region = [removed]
+        dist[removed] = self.numCells
+        owner[removed] = -1
+        for cell in region:
+            for n in neighborCells[cell]:
+                if owner[n] == removed:
+                    dist[n] = self.numCells
+                    owner[n] = -1
+                    region.append(n)
+
+        # Regrow the region from the distances around its edge
+        fringe = []
+        for cell in region:
+            for n in neighborCells[cell]:
+                if owner[n] != -1:
+                    heapq.heappush(fringe, (dist[n] + 1, cell, owner[n]))
+        while fringe:
+            d, cell, source = heapq.heappop(fringe)
+            if d >= dist[cell]: continue
+            dist[cell] = d
+            owner[cell] = source
+            for n in neighborCells[cell]:
+                if d + 1 < dist[n]:
+                    heapq.heappush(fringe, (d + 1, n, source))
+        return DistanceField(self.adjacency, dist, owner)
+
+def computeDistanceField(grid, adjacency):
+    "Builds the DistanceField to the set cells of a BitGrid with a breadth-first search from all of them"
+    numCells = grid.width * grid.height
+    neighborCells = adjacency.neighborCells
+    dist = array('l', [numCells]) * numCells
+    owner = array('l', [-1]) * numCells
+    fringe = deque()
+    sources = grid.bits & ~adjacency.wallBits
+    while sources:
+        lowest = sources & -sources
+        cell = lowest.bit_length() - 1
+        dist[cell] = 0
+        owner[cell] = cell
+        fringe.append(cell)
+        sources ^= lowest
+    while fringe:
+        cell = fringe.popleft()
+        d = dist[cell] + 1
+        for n in neighborCells[cell]:
+            if dist[n] == numCells:
+                dist[n] = d
+                owner[n] = owner[cell]
+                fringe.append(n)
+    return DistanceField(adjacency, dist, owner)
+
+STATE_KEY_DIRECTIONS = {Directions.NORTH: 1, Directions.SOUTH: 2, Directions.EAST: 3,
+                        Directions.WEST: 4, Directions.STOP: 5}
+ZOBRIST_MASK = (1 << 64) - 1
+ZOBRIST_SCORE_MULTIPLIER = 0x9E3779B97F4A7C15
+_zobristKeys = {}
+_zobristRandom = random.Random('zobrist')
+
+def zobristKey(feature):
+    """
+    Returns the random 64-bit key Zobrist hashing assigns to one feature of
+    a game state, such as ('food', x, y) or ('agent', index, pos, direction,
+    scaredTimer).  Keys are drawn the first time a feature is seen.
+    """
+    key = _zobristKeys.get(feature)
+    if key is None:
+        key = _zobristKeys[feature] = _zobristRandom.getrandbits(64)
+    return key
+
 class GameStateData:
     """
 
@@ -376,6 +767,9 @@ class GameStateData:
         """
         Generates a new data packet by copying information from its predecessor.
         """
+        self._zobrist = None
+        self._agentKeys = None
+        self._stateKey = None
         if prevState != None:
             self.food = prevState.food.shallowCopy()
             self.capsules = prevState.capsules[:]
@@ -383,6 +777,8 @@ class GameStateData:
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._zobrist = prevState._zobrist
+            self._agentKeys = prevState._agentKeys
 
         self._foodEaten = None
         self._foodAdded = None
@@ -393,9 +789,14 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        """
+        Copies the per-agent data and shares everything else.  The layout
+        is immutable and shared by every state of a game, and the food grid
+        is copy-on-write: the rules copy it before eating a pellet (see
+        PacmanRules.consume), so a copy only costs as much as the number
+        of agents and capsules, whatever the size of the maze.
+        """
         state = GameStateData( self )
-        state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -424,13 +825,125 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return hash( self.getFingerprint() )
+
+    def getFingerprint( self ):
+        """
+        Returns a 64-bit Zobrist hash of the agent configurations and scared
+        timers, the food, the capsules and the score.  Equal states have
+        equal fingerprints, so transposition tables and Q-tables can key on
+        it directly.  The board part is kept up to date by updateZobrist as
+        successors are generated, so this costs the same on any board
+        (code that edits agentStates directly calls agentStatesChanged).
+        """
+        if self._zobrist is None:
+            self.initializeZobrist()
+        # Whole scores are mixed in as they are, since hash(-1) == hash(-2)
+        score = self.score
+        if isinstance(score, float) and score.is_integer(): score = int(score)
+        if not isinstance(score, (int, long)): score = hash(score)
+        return self._zobrist ^ ((score * ZOBRIST_SCORE_MULTIPLIER) & ZOBRIST_MASK)
+
+    def getStateKey( self ):
+        """
+        Returns the state packed into one integer, for keying tables of
+        values by state without keeping the state alive.  Unlike the
+        fingerprint it is exact: two states of the same layout share a key
+        exactly when they agree on Pacman's position, each ghost's position,
+        direction and scared timer, the food and the capsules.  The score is
+        left out, since it does not change what can happen next.
+
+        From the low bits up, the key holds a bit per cell for the food,
+        the same for the capsules, then a field per agent: its position at
+        half-square resolution, and for ghosts also its direction and
+        scared timer.
+        """
+        if self._stateKey is None:
+            width, height = self.layout.width, self.layout.height
+            numCells = width * height
+            if isinstance(self.food, BitGrid):
+                key = self.food.bits
+            else:
+                key = 0
+                for x, y in self.food.asList(): key |= 1 << (x * height + y)
+            capsules = 0
+            for x, y in self.capsules: capsules |= 1 << (x * height + y)
+            key |= capsules << numCells
+            shift = 2 * numCells
+            positionBits = (4 * numCells).bit_length()
+            for index, agentState in enumerate(self.agentStates):
+                # Hidden agents (see BustersAgent.observationFunction) are None
+                configuration = agentState and agentState.configuration
+                if configuration == None:
+                    field = 0
+                else:
+                    x, y = configuration.pos
+                    field = 1 + int(round(2 * x)) * 2 * height + int(round(2 * y))
+                key |= field << shift
+                shift += positionBits
+                if index > 0:
+                    direction = STATE_KEY_DIRECTIONS.get(configuration and configuration.direction, 0)
+                    scaredTimer = agentState and agentState.scaredTimer or 0
+                    key |= (direction | min(scaredTimer, 255) << 3) << shift
+                    shift += 11
+            self._stateKey = key
+        return self._stateKey
+
+    def agentStatesChanged( self ):
+        """
+        Forgets the fingerprint and state key, which are worked out again
+        when next asked for.  Code that replaces or edits agentStates itself,
+        rather than through the game rules, must call this afterwards.
+        """
+        self._zobrist = None
+        self._agentKeys = None
+        self._stateKey = None
+
+    def initializeZobrist( self ):
+        """
+        Computes the Zobrist hash of the agents, food and capsules from scratch.
+        """
+        self._agentKeys = [self._agentZobristKey(index, agentState) for index, agentState in enumerate(self.agentStates)]
+        zobrist = 0
+        for key in self._agentKeys:
+            zobrist ^= key
+        for x, y in self.food.asList():
+            zobrist ^= zobristKey(('food', x, y))
+        for x, y in self.capsules:
+            zobrist ^= zobristKey(('capsule', x, y))
+        self._zobrist = zobrist
+
+    def updateZobrist( self ):
+        """
+        Folds the last move into the Zobrist hash inherited from the
+        predecessor state: the agents whose configuration or scared timer
+        changed, and the food and capsule eaten.  Called by the game rules
+        once a successor has been generated.
+        """
+        if self._zobrist is None or self._agentKeys is None:
+            self.initializeZobrist()
+            return
+        zobrist = self._zobrist
+        agentKeys = self._agentKeys[:] # Shared with the predecessor
+        for index, agentState in enumerate(self.agentStates):
+            key = self._agentZobristKey(index, agentState)
+            if key != agentKeys[index]:
+                zobrist ^= agentKeys[index] ^ key
+                agentKeys[index] = key
+        if self._foodEaten != None:
+            x, y = self._foodEaten
+            zobrist ^= zobristKey(('food', x, y))
+        if self._capsuleEaten != None:
+            x, y = self._capsuleEaten
+            zobrist ^= zobristKey(('capsule', x, y))
+        self._zobrist = zobrist
+        self._agentKeys = agentKeys
+
+    def _agentZobristKey( self, index, agentState ):
+        if agentState == None or agentState.configuration == None:
+            return zobristKey(('agent', index, None))
+        configuration = agentState.configuration
+        return zobristKey(('agent', index, configuration.pos, configuration.direction, agentState.scaredTimer))
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -503,6 +1016,7 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self.initializeZobrist()
 
 try:
     import boinc
@@ -526,6 +1040,10 @@ class Game:
         self.catchExceptions = catchExceptions
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
+        self.agentMoveTimes = [[] for agent in agents]
+        # Kept with the timings, for games whose agents are dropped (see
+        # pacman.runGamesInParallel)
+        self.agentNames = [agent.__class__.__name__ for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
         import cStringIO
@@ -604,7 +1122,9 @@ class Game:
                         self.unmute()
                         return
                 else:
+                    start_time = time.time()
                     agent.registerInitialState(self.state.deepCopy())
+                    self.totalAgentTimes[i] += time.time() - start_time
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -616,7 +1136,9 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
-            # Generate an observation of the state
+            # Generate an observation of the state.  Observations share the
+            # layout and food grid with the game state (copy-on-write), so
+            # handing one to an agent does not copy the board.
             if 'observationFunction' in dir( agent ):
                 self.mute(agentIndex)
                 if self.catchExceptions:
@@ -634,7 +1156,9 @@ class Game:
                         self.unmute()
                         return
                 else:
+                    start_time = time.time()
                     observation = agent.observationFunction(self.state.deepCopy())
+                    move_time += time.time() - start_time
                 self.unmute()
             else:
                 observation = self.state.deepCopy()
@@ -683,7 +1207,11 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                move_time += time.time() - start_time
+                self.totalAgentTimes[agentIndex] += move_time
+            self.agentMoveTimes[agentIndex].append(move_time)
             self.unmute()
 
             # Execute the action
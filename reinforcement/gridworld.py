@@ -32,6 +32,10 @@ class Gridworld(mdp.MarkovDecisionProcess):
         self.livingReward = 0.0
         self.noise = 0.2
 
+        # (state, action) -> [(nextState, prob)], filled in as transitions
+        # are asked for.  Only the noise changes them (the grid is fixed).
+        self.transitions = {}
+
     def setLivingReward(self, reward):
         """
         The (negative) reward for exiting "normal" states.
@@ -41,12 +45,15 @@ class Gridworld(mdp.MarkovDecisionProcess):
         future rewards.
         """
         self.livingReward = reward
+        self.notifyChange('livingReward')
 
     def setNoise(self, noise):
         """
         The probability of moving in an unintended direction.
         """
         self.noise = noise
+        self.transitions = {}
+        self.notifyChange('noise')
 
 
     def getPossibleActions(self, state):
@@ -118,7 +125,12 @@ class Gridworld(mdp.MarkovDecisionProcess):
         from 'state' by taking 'action' along
         with their transition probabilities.
         """
+        successors = self.transitions.get((state, action))
+        if successors is None:
+            successors = self.transitions[(state, action)] = self.__computeTransitionStatesAndProbs(state, action)
+        return list(successors)
 
+    def __computeTransitionStatesAndProbs(self, state, action):
         if action not in self.getPossibleActions(state):
             raise "Illegal action!"
 
@@ -311,6 +323,46 @@ def getMazeGrid():
             ['S',' ',' ',' ']]
     return Gridworld(grid)
 
+def generateGridworld(width, height, seed=None, wallDensity=0.2, numExits=2, rewards=(-10, 10)):
+    """
+    Returns a random width x height Gridworld, for scaling experiments.  The
+    same seed always gives the same grid.
+
+    About wallDensity of the squares are walls, and squares that cannot be
+    reached from the start are walled off too.  numExits exits are placed
+    on reachable squares, the i-th with reward rewards[i % len(rewards)].
+    """
+    rand = random.Random(seed)
+    if width * height < numExits + 1: raise Exception('Not enough squares for the start and exits')
+    grid = [[' ' for x in range(width)] for y in range(height)]
+    squares = [(x, y) for x in range(width) for y in range(height)]
+    rand.shuffle(squares)
+    startX, startY = squares.pop()
+    grid[startY][startX] = 'S'
+    for x, y in squares[:int(wallDensity * len(squares))]:
+        grid[y][x] = '#'
+
+    # Wall off whatever the start cannot reach
+    reached = set([(startX, startY)])
+    fringe = [(startX, startY)]
+    while fringe:
+        x, y = fringe.pop()
+        for nextX, nextY in [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]:
+            if 0 <= nextX < width and 0 <= nextY < height and grid[nextY][nextX] != '#' \
+                    and (nextX, nextY) not in reached:
+                reached.add((nextX, nextY))
+                fringe.append((nextX, nextY))
+    for x, y in squares:
+        if (x, y) not in reached: grid[y][x] = '#'
+
+    free = [square for square in squares if square in reached]
+    if len(free) < numExits:
+        raise Exception('Not enough reachable squares for %d exits' % numExits)
+    for i in range(numExits):
+        x, y = free[i]
+        grid[y][x] = rewards[i % len(rewards)]
+    return Gridworld(grid)
+
 
 
 def getUserAction(state, actionFunction):
@@ -377,6 +429,9 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
     if 'stopEpisode' in dir(agent):
         agent.stopEpisode()
 
+# Most rounds of value iteration run with --tolerance but without -i
+TOLERANCE_ITERATIONS = 10000
+
 def parseOptions():
     optParser = optparse.OptionParser()
     optParser.add_option('-d', '--discount',action='store',
@@ -396,19 +451,23 @@ def parseOptions():
                          type='float',dest='learningRate',default=0.5,
                          metavar="P", help='TD learning rate (default %default)' )
     optParser.add_option('-i', '--iterations',action='store',
-                         type='int',dest='iters',default=10,
-                         metavar="K", help='Number of rounds of value iteration (default %default)')
+                         type='int',dest='iters',default=None,
+                         metavar="K", help='Number of rounds of value iteration (default 10, or %d with --tolerance)' % TOLERANCE_ITERATIONS)
     optParser.add_option('-k', '--episodes',action='store',
                          type='int',dest='episodes',default=1,
                          metavar="K", help='Number of epsiodes of the MDP to run (default %default)')
     optParser.add_option('-g', '--grid',action='store',
                          metavar="G", type='string',dest='grid',default="BookGrid",
                          help='Grid to use (case sensitive; options are BookGrid, BridgeGrid, CliffGrid, MazeGrid, default %default)' )
+    optParser.add_option('--generate', metavar="WxH", type='string', dest='generate', default=None,
+                         help='Use a random WxH grid instead (see generateGridworld)')
+    optParser.add_option('--seed', type='string', dest='seed', default=None,
+                         help='Random seed for --generate, for the same grid every time')
     optParser.add_option('-w', '--windowSize', metavar="X", type='int',dest='gridSize',default=150,
                          help='Request a window width of X pixels *per grid cell* (default %default)')
     optParser.add_option('-a', '--agent',action='store', metavar="A",
                          type='string',dest='agent',default="random",
-                         help='Agent type (options are \'random\', \'value\' and \'q\', default %default)')
+                         help='Agent type (options are \'random\', \'value\', \'prioritized\', \'policy\', \'modifiedPolicy\', \'q\', \'qLambda\' and \'sarsaLambda\', default %default)')
     optParser.add_option('-t', '--text',action='store_true',
                          dest='textDisplay',default=False,
                          help='Use text-only ASCII display')
@@ -426,9 +485,41 @@ def parseOptions():
                          help='Manually control agent')
     optParser.add_option('-v', '--valueSteps',action='store_true' ,default=False,
                          help='Display each step of value iteration')
+    optParser.add_option('--arrayTable',action='store_true',
+                         dest='arrayTable',default=False,
+                         help='Keep the Q-learning agent\'s Q-values in a flat array (see qlearningAgents.QTable)')
+    optParser.add_option('--profile',action='store', metavar="PREFIX",
+                         type='string',dest='profile',default=None,
+                         help='Profile solving the MDP and the episodes, writing PREFIX.prof, PREFIX.txt and PREFIX.collapsed (see profiling.py)')
+    optParser.add_option('--tolerance',action='store',
+                         type='float',dest='tolerance',default=None,
+                         help='Stop value iteration early once no value changes by this much in an iteration; ' +
+                         'unless -i is given, up to %d iterations are run' % TOLERANCE_ITERATIONS)
+    optParser.add_option('--inPlace',action='store_true',
+                         dest='inPlace',default=False,
+                         help='Update values in place during each round of value iteration (Gauss-Seidel)')
+    optParser.add_option('--theta',action='store',
+                         type='float',dest='theta',default=1e-5,
+                         help='Smallest Bellman error prioritized sweeping backs a state up for (default %default)')
+    optParser.add_option('--maxBackups',action='store',
+                         type='int',dest='maxBackups',default=None,
+                         help='Most state backups prioritized sweeping does (default: until no error is above theta)')
+    optParser.add_option('--lambda',action='store',
+                         type='float',dest='traceDecay',default=0.9,
+                         help='Trace decay of the qLambda and sarsaLambda agents (default %default)')
+    optParser.add_option('--evaluationSweeps',action='store',
+                         type='int',dest='evaluationSweeps',default=20,
+                         help='Sweeps of policy evaluation per round of modified policy iteration (default %default)')
 
     opts, args = optParser.parse_args()
 
+    # With a tolerance, the number of iterations is only a safety cap
+    if opts.iters is None:
+        if opts.tolerance is None: opts.iters = 10
+        else: opts.iters = TOLERANCE_ITERATIONS
+
+    # Only plain Q-learning can learn from actions it didn't choose; the
+    # lambda agents choose each next action as part of their update
     if opts.manual and opts.agent != 'q':
         print '## Disabling Agents in Manual Mode (-m) ##'
         opts.agent = None
@@ -454,8 +545,12 @@ if __name__ == '__main__':
     ###########################
 
     import gridworld
-    mdpFunction = getattr(gridworld, "get"+opts.grid)
-    mdp = mdpFunction()
+    if opts.generate:
+        width, height = [int(size) for size in opts.generate.lower().split('x')]
+        mdp = gridworld.generateGridworld(width, height, opts.seed)
+    else:
+        mdpFunction = getattr(gridworld, "get"+opts.grid)
+        mdp = mdpFunction()
     mdp.setLivingReward(opts.livingReward)
     mdp.setNoise(opts.noise)
     env = gridworld.GridworldEnvironment(mdp)
@@ -480,10 +575,30 @@ if __name__ == '__main__':
     ###########################
 
     import valueIterationAgents, qlearningAgents
+    # Agents that solve the MDP before any episodes are run
+    plannerAgents = ['value', 'prioritized', 'policy', 'modifiedPolicy']
+    # Agents that learn Q-values from the episodes
+    learnerAgents = ['q', 'qLambda', 'sarsaLambda']
     a = None
+    profiler = None
+    if opts.profile:
+        import profiling
+        profiler = profiling.Profiler()
+        profiler.start()
     if opts.agent == 'value':
-        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters)
-    elif opts.agent == 'q':
+        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters, opts.tolerance, opts.inPlace,
+                                                     keepHistory = opts.valueSteps)
+        print "VALUE ITERATION RAN %d ITERATIONS, FINAL RESIDUAL %s" % (a.iterationsUsed, a.residual)
+    elif opts.agent == 'prioritized':
+        a = valueIterationAgents.PrioritizedSweepingValueIterationAgent(mdp, opts.discount, opts.maxBackups, opts.theta)
+        print "PRIORITIZED SWEEPING DID %d BACKUPS, LARGEST ERROR LEFT %s" % (a.backups, a.residual)
+    elif opts.agent == 'policy':
+        a = valueIterationAgents.PolicyIterationAgent(mdp, opts.discount, opts.iters)
+        print "POLICY ITERATION EVALUATED %d POLICIES" % a.iterationsUsed
+    elif opts.agent == 'modifiedPolicy':
+        a = valueIterationAgents.ModifiedPolicyIterationAgent(mdp, opts.discount, opts.iters, opts.evaluationSweeps)
+        print "MODIFIED POLICY ITERATION EVALUATED %d POLICIES, FINAL RESIDUAL %s" % (a.iterationsUsed, a.residual)
+    elif opts.agent in learnerAgents:
         #env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon
         #simulationFn = lambda agent, state: simulation.GridworldSimulation(agent,state,mdp)
         gridWorldEnv = GridworldEnvironment(mdp)
@@ -491,8 +606,16 @@ if __name__ == '__main__':
         qLearnOpts = {'gamma': opts.discount,
                       'alpha': opts.learningRate,
                       'epsilon': opts.epsilon,
-                      'actionFn': actionFn}
-        a = qlearningAgents.QLearningAgent(**qLearnOpts)
+                      'actionFn': actionFn,
+                      'arrayTable': opts.arrayTable}
+        if opts.agent == 'q':
+            a = qlearningAgents.QLearningAgent(**qLearnOpts)
+        else:
+            qLearnOpts['traceDecay'] = opts.traceDecay
+            if opts.agent == 'qLambda':
+                a = qlearningAgents.QLambdaAgent(**qLearnOpts)
+            else:
+                a = qlearningAgents.SarsaLambdaAgent(**qLearnOpts)
     elif opts.agent == 'random':
         # # No reason to use the random agent without episodes
         if opts.episodes == 0:
@@ -512,6 +635,7 @@ if __name__ == '__main__':
         a = RandomAgent()
     else:
         if not opts.manual: raise 'Unknown agent type: '+opts.agent
+    if profiler: profiler.stop()
 
 
     ###########################
@@ -519,16 +643,16 @@ if __name__ == '__main__':
     ###########################
     # DISPLAY Q/V VALUES BEFORE SIMULATION OF EPISODES
     try:
-        if not opts.manual and opts.agent == 'value':
-            if opts.valueSteps:
-                for i in range(opts.iters):
-                    tempAgent = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, i)
+        if not opts.manual and opts.agent in plannerAgents:
+            if opts.valueSteps and opts.agent == 'value':
+                for i in range(a.iterationsUsed):
+                    tempAgent = a.getSnapshot(i)
                     display.displayValues(tempAgent, message = "VALUES AFTER "+str(i)+" ITERATIONS")
                     display.pause()
 
-            display.displayValues(a, message = "VALUES AFTER "+str(opts.iters)+" ITERATIONS")
+            display.displayValues(a, message = "VALUES AFTER "+str(a.iterationsUsed)+" ITERATIONS")
             display.pause()
-            display.displayQValues(a, message = "Q-VALUES AFTER "+str(opts.iters)+" ITERATIONS")
+            display.displayQValues(a, message = "Q-VALUES AFTER "+str(a.iterationsUsed)+" ITERATIONS")
             display.pause()
     except KeyboardInterrupt:
         sys.exit(0)
@@ -542,8 +666,8 @@ if __name__ == '__main__':
             displayCallback = lambda state: display.displayNullValues(state)
         else:
             if opts.agent == 'random': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
-            if opts.agent == 'value': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
-            if opts.agent == 'q': displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES")
+            if opts.agent in plannerAgents: displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
+            if opts.agent in learnerAgents: displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES")
 
     messageCallback = lambda x: printString(x)
     if opts.quiet:
@@ -559,6 +683,9 @@ if __name__ == '__main__':
         decisionCallback = lambda state : getUserAction(state, mdp.getPossibleActions)
     else:
         decisionCallback = a.getAction
+        if profiler:
+            moveTimes = profiler.getMoveTimes('Agent (%s)' % a.__class__.__name__)
+            decisionCallback = profiling.timedCalls(decisionCallback, moveTimes)
 
     # RUN EPISODES
     if opts.episodes > 0:
@@ -566,8 +693,12 @@ if __name__ == '__main__':
         print "RUNNING", opts.episodes, "EPISODES"
         print
     returns = 0
+    if profiler: profiler.start()
     for episode in range(1, opts.episodes+1):
         returns += runEpisode(a, env, opts.discount, decisionCallback, displayCallback, messageCallback, pauseCallback, episode)
+    if profiler:
+        profiler.stop()
+        profiler.write(opts.profile)
     if opts.episodes > 0:
         print
         print "AVERAGE RETURNS FROM START STATE: "+str((returns+0.0) / opts.episodes)
@@ -575,7 +706,7 @@ if __name__ == '__main__':
         print
 
     # DISPLAY POST-LEARNING VALUES / Q-VALUES
-    if opts.agent == 'q' and not opts.manual:
+    if opts.agent in learnerAgents and not opts.manual:
         try:
             display.displayQValues(a, message = "Q-VALUES AFTER "+str(opts.episodes)+" EPISODES")
             display.pause()
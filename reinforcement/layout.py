@@ -13,7 +13,7 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, BitGrid
 import os
 import random
 
@@ -27,14 +27,14 @@ class Layout:
     def __init__(self, layoutText):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.walls = BitGrid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -90,7 +90,13 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        """
+        Layouts are never modified once parsed, so every game state built
+        from this layout shares the same object instead of re-parsing the
+        layout text.  Game states copy the food grid and capsule list they
+        start from (see GameStateData.initialize).
+        """
+        return self
 
     def processLayoutText(self, layoutText):
         """
@@ -147,3 +153,105 @@ def tryToLoad(fullname):
     f = open(fullname)
     try: return Layout([line.strip() for line in f])
     finally: f.close()
+
+def generateLayoutText(width, height, seed=None, wallDensity=0.35, numGhosts=2,
+                       foodDensity=0.6, numCapsules=2):
+    """
+    Returns the text of a random maze, in the format of the .lay files, for
+    scaling experiments.  The same seed always gives the same maze.
+
+    The maze is carved into a width x height board (odd sizes fit best)
+    surrounded by walls, then walls are knocked out at random until at most
+    wallDensity of the inside of the board is wall, which opens up loops.
+    Pacman, numGhosts ghosts and numCapsules capsules go on distinct open
+    squares, and food on foodDensity of the squares left over.  Every open
+    square can be reached from every other.
+    """
+    rand = random.Random(seed)
+    if width < 3 or height < 3: raise Exception('Layouts must be at least 3x3')
+    walls = [[True for y in range(height)] for x in range(width)]
+
+    # Carve a spanning tree over the cells with odd coordinates
+    start = (1, 1)
+    walls[1][1] = False
+    stack = [start]
+    while stack:
+        x, y = stack[-1]
+        unvisited = [(dx, dy) for dx, dy in [(0, 2), (0, -2), (2, 0), (-2, 0)]
+                     if 0 < x + dx < width - 1 and 0 < y + dy < height - 1 and walls[x + dx][y + dy]]
+        if not unvisited:
+            stack.pop()
+            continue
+        dx, dy = rand.choice(unvisited)
+        walls[x + dx / 2][y + dy / 2] = False
+        walls[x + dx][y + dy] = False
+        stack.append((x + dx, y + dy))
+
+    # Knock out walls next to open squares (so the maze stays connected)
+    # until the density is low enough
+    inside = (width - 2) * (height - 2)
+    candidates = [(x, y) for x in range(1, width - 1) for y in range(1, height - 1) if walls[x][y]]
+    rand.shuffle(candidates)
+    numWalls = len(candidates)
+    for x, y in candidates:
+        if numWalls <= wallDensity * inside: break
+        if not walls[x - 1][y] or not walls[x + 1][y] or not walls[x][y - 1] or not walls[x][y + 1]:
+            walls[x][y] = False
+            numWalls -= 1
+
+    openSquares = [(x, y) for x in range(width) for y in range(height) if not walls[x][y]]
+    rand.shuffle(openSquares)
+    if len(openSquares) < 1 + numGhosts + numCapsules:
+        raise Exception('Not enough open squares for the agents and capsules')
+    contents = {}
+    contents[openSquares.pop()] = 'P'
+    for i in range(numGhosts): contents[openSquares.pop()] = 'G'
+    for i in range(numCapsules): contents[openSquares.pop()] = 'o'
+    for pos in openSquares[:int(round(foodDensity * len(openSquares)))]: contents[pos] = '.'
+
+    lines = []
+    for y in range(height - 1, -1, -1):
+        line = ''
+        for x in range(width):
+            if walls[x][y]: line += '%'
+            else: line += contents.get((x, y), ' ')
+        lines.append(line)
+    return lines
+
+def generateLayout(width, height, seed=None, **args):
+    "Returns a random Layout; see generateLayoutText for the options"
+    return Layout(generateLayoutText(width, height, seed, **args))
+
+if __name__ == '__main__':
+    """
+    Writes a generated layout to a .lay file (or prints it):
+
+    > python layout.py -W 101 -H 51 -s 1 -k 4 -o layouts/big.lay
+    """
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('-W', '--width', type='int', dest='width', default=41,
+                      help='Width of the layout (default %default)')
+    parser.add_option('-H', '--height', type='int', dest='height', default=21,
+                      help='Height of the layout (default %default)')
+    parser.add_option('-s', '--seed', dest='seed', default=None,
+                      help='Random seed, for the same layout every time')
+    parser.add_option('-w', '--wallDensity', type='float', dest='wallDensity', default=0.35,
+                      help='Largest fraction of the inside of the board that is wall (default %default)')
+    parser.add_option('-k', '--numGhosts', type='int', dest='numGhosts', default=2,
+                      help='Number of ghosts (default %default)')
+    parser.add_option('-f', '--foodDensity', type='float', dest='foodDensity', default=0.6,
+                      help='Fraction of the free squares with food (default %default)')
+    parser.add_option('-c', '--numCapsules', type='int', dest='numCapsules', default=2,
+                      help='Number of capsules (default %default)')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='The .lay file to write (default: print the layout)')
+    options, otherjunk = parser.parse_args()
+    text = generateLayoutText(options.width, options.height, options.seed, options.wallDensity,
+                              options.numGhosts, options.foodDensity, options.numCapsules)
+    if options.output is None:
+        print '\n'.join(text)
+    else:
+        f = open(options.output, 'w')
+        try: f.write('\n'.join(text) + '\n')
+        finally: f.close()
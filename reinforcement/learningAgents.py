@@ -15,6 +15,7 @@
 from game import Directions, Agent, Actions
 
 import random,util,time
+from array import array
 
 class ValueEstimationAgent(Agent):
     """
@@ -84,6 +85,71 @@ class ValueEstimationAgent(Agent):
         """
         util.raiseNotDefined()
 
+class ReplayBuffer:
+    """
+      The last capacity (state, action, nextState, reward) transitions, in
+      a ring: once it is full each new transition replaces the oldest.
+      Rewards and priorities are kept in float arrays, and the priorities
+      also in a sum tree over a power-of-two number of leaves, so that a
+      transition can be drawn with probability proportional to its
+      priority in time logarithmic in the capacity.  The states and
+      actions are the objects the agent was given (whole GameStates in
+      Pacman), held in plain lists, so only the numbers are compact.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.states = [None] * capacity
+        self.actions = [None] * capacity
+        self.nextStates = [None] * capacity
+        self.rewards = array('d', [0.0]) * capacity
+        self.size = 0
+        self.next = 0
+        self.maxPriority = 1.0
+        self.leaves = 1
+        while self.leaves < capacity: self.leaves *= 2
+        self.priorityTree = array('d', [0.0]) * (2 * self.leaves)
+
+    def add(self, state, action, nextState, reward):
+        """
+          Stores a transition, with the largest priority given so far so
+          that it is likely to be replayed at least once.
+        """
+        index = self.next
+        self.states[index] = state
+        self.actions[index] = action
+        self.nextStates[index] = nextState
+        self.rewards[index] = reward
+        self.setPriority(index, self.maxPriority)
+        self.next = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def get(self, index):
+        return self.states[index], self.actions[index], self.nextStates[index], self.rewards[index]
+
+    def setPriority(self, index, priority):
+        self.maxPriority = max(self.maxPriority, priority)
+        node = self.leaves + index
+        change = priority - self.priorityTree[node]
+        while node >= 1:
+            self.priorityTree[node] += change
+            node /= 2
+
+    def sampleUniform(self):
+        "The index of a stored transition, each equally likely"
+        return random.randrange(self.size)
+
+    def samplePrioritized(self):
+        "The index of a stored transition, drawn in proportion to its priority"
+        target = random.random() * self.priorityTree[1]
+        node = 1
+        while node < self.leaves:
+            node *= 2
+            if target >= self.priorityTree[node]:
+                target -= self.priorityTree[node]
+                node += 1
+        return min(node - self.leaves, self.size - 1)
+
 class ReinforcementAgent(ValueEstimationAgent):
     """
       Abstract Reinforcemnt Agent: A ValueEstimationAgent
@@ -131,6 +197,29 @@ class ReinforcementAgent(ValueEstimationAgent):
         """
         self.episodeRewards += deltaReward
         self.update(state,action,nextState,deltaReward)
+        if self.replayBuffer is not None:
+            self.replayBuffer.add(state, action, nextState, deltaReward)
+            # Fractional ratios replay a transition every few steps
+            self.replayCredit += self.replayRatio
+            while self.replayCredit >= 1:
+                self.replayCredit -= 1
+                if self.alpha: self.replayTransition()
+
+    def replayTransition(self):
+        """
+          Learns again from a stored transition, drawn uniformly or, with
+          prioritized replay, in proportion to its last TD error (raised
+          to priorityExponent), which is then brought up to date.
+        """
+        buffer = self.replayBuffer
+        if not self.prioritizedReplay:
+            self.update(*buffer.get(buffer.sampleUniform()))
+            return
+        index = buffer.samplePrioritized()
+        state, action, nextState, reward = buffer.get(index)
+        error = reward + self.discount * self.getValue(nextState) - self.getQValue(state, action)
+        buffer.setPriority(index, (abs(error) + 1e-6) ** self.priorityExponent)
+        self.update(state, action, nextState, reward)
 
     def startEpisode(self):
         """
@@ -160,7 +249,8 @@ class ReinforcementAgent(ValueEstimationAgent):
     def isInTesting(self):
         return not self.isInTraining()
 
-    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1,
+                 replayRatio=0, replayCapacity=10000, prioritizedReplay=False, priorityExponent=0.6):
         """
         actionFn: Function which takes a state and returns the list of legal actions
 
@@ -168,6 +258,10 @@ class ReinforcementAgent(ValueEstimationAgent):
         epsilon  - exploration rate
         gamma    - discount factor
         numTraining - number of training episodes, i.e. no learning after these many episodes
+        replayRatio - transitions replayed from a ReplayBuffer per transition observed
+        replayCapacity - number of transitions the buffer keeps
+        prioritizedReplay - replay transitions with large TD errors more often
+        priorityExponent - how strongly to prefer them (0 is uniform)
         """
         if actionFn == None:
             actionFn = lambda state: state.getLegalActions()
@@ -179,6 +273,13 @@ class ReinforcementAgent(ValueEstimationAgent):
         self.epsilon = float(epsilon)
         self.alpha = float(alpha)
         self.discount = float(gamma)
+        self.replayRatio = float(replayRatio)
+        self.prioritizedReplay = str(prioritizedReplay).lower() in ('1', 'true', 'yes')
+        self.priorityExponent = float(priorityExponent)
+        self.replayCredit = 0.0
+        self.replayBuffer = None
+        if self.replayRatio > 0:
+            self.replayBuffer = ReplayBuffer(int(replayCapacity))
 
     ################################
     # Controls needed for Crawler  #
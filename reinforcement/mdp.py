@@ -13,6 +13,7 @@
 
 
 import random
+from array import array
 
 class MarkovDecisionProcess:
 
@@ -65,3 +66,260 @@ class MarkovDecisionProcess:
         are equivalent.
         """
         abstract
+
+    def addChangeListener(self, listener):
+        """
+        Registers a function to be called as listener(mdp, change) whenever
+        a parameter of the MDP that its transitions or rewards depend on is
+        changed, with change naming the parameter (e.g. 'noise').
+        """
+        if not hasattr(self, 'changeListeners'): self.changeListeners = []
+        self.changeListeners.append(listener)
+
+    def removeChangeListener(self, listener):
+        self.changeListeners.remove(listener)
+
+    def notifyChange(self, change):
+        "Tells the registered listeners that the named parameter has changed"
+        for listener in list(getattr(self, 'changeListeners', [])):
+            listener(self, change)
+
+# Elimination pivots smaller than this mean the policy's equations have no
+# unique solution
+SINGULAR_PIVOT = 1e-12
+
+class CompiledMDP:
+    """
+    A MarkovDecisionProcess with its states numbered and all of its
+    transitions read out once into flat arrays, so that solvers can sweep
+    over it without calling back into the MDP.
+
+    State i is states[i], with actions[i] its possible actions.  Each
+    (state, action) pair is a row: the rows of state i run from
+    rowStart[i] to rowStart[i+1], in the order of actions[i].  The
+    transitions of row r run from transitionStart[r] to
+    transitionStart[r+1], in the order getTransitionStatesAndProbs gave
+    them, each with its successor's index, probability and reward.
+
+    Successors that getStates doesn't list are numbered after the listed
+    states, with no actions.
+    """
+    def __init__(self, mdp):
+        self.mdp = mdp
+        self.states = list(mdp.getStates())
+        self.stateIndices = dict([(state, i) for i, state in enumerate(self.states)])
+        self.actions = []
+        self.rowStart = array('l', [0])
+        self.transitionStart = array('l', [0])
+        self.successors = array('l')
+        self.probs = array('d')
+        self.rewards = array('d')
+
+        for state in list(self.states):
+            actions = tuple(mdp.getPossibleActions(state))
+            for action in actions:
+                for nextState, prob in mdp.getTransitionStatesAndProbs(state, action):
+                    self.successors.append(self.getIndex(nextState))
+                    self.probs.append(prob)
+                    self.rewards.append(mdp.getReward(state, action, nextState))
+                self.transitionStart.append(len(self.successors))
+            self.actions.append(actions)
+            self.rowStart.append(len(self.transitionStart) - 1)
+        for state in self.states[len(self.actions):]:
+            self.actions.append(())
+            self.rowStart.append(len(self.transitionStart) - 1)
+        self.numStates = len(self.states)
+
+    def getIndex(self, state):
+        "Returns the number of a state, numbering it if it is new"
+        index = self.stateIndices.get(state)
+        if index is None:
+            index = self.stateIndices[state] = len(self.states)
+            self.states.append(state)
+        return index
+
+    def getPredecessors(self):
+        """
+        Returns, for each state index, the sorted indices of the states that
+        have some action with a chance of leading to it.
+        """
+        predecessors = [set() for i in range(self.numStates)]
+        for i in xrange(self.numStates):
+            for t in xrange(self.transitionStart[self.rowStart[i]], self.transitionStart[self.rowStart[i + 1]]):
+                if self.probs[t] > 0:
+                    predecessors[self.successors[t]].add(i)
+        return [sorted(states) for states in predecessors]
+
+    def getProperRows(self):
+        """
+        Returns a policy (one row per state, -1 for states without actions)
+        that reaches a state without actions from every state that can reach
+        one at all, so that its values are finite even with no discount.
+        Working back from the states without actions, each state takes the
+        first of its actions with a chance of leading to a state already
+        given an action.  States that can't reach one take their first
+        action.
+        """
+        rows = array('l', [-1]) * self.numStates
+        predecessors = self.getPredecessors()
+        done = [not actions for actions in self.actions]
+        frontier = [i for i in xrange(self.numStates) if done[i]]
+        while frontier:
+            newFrontier = []
+            for j in frontier:
+                for i in predecessors[j]:
+                    if done[i]: continue
+                    for row in xrange(self.rowStart[i], self.rowStart[i + 1]):
+                        if self.leadsTo(row, done):
+                            rows[i] = row
+                            break
+                    done[i] = True
+                    newFrontier.append(i)
+            frontier = newFrontier
+        for i in xrange(self.numStates):
+            if not done[i]: rows[i] = self.rowStart[i]
+        return rows
+
+    def leadsTo(self, row, states):
+        "Whether a row has a chance of leading to a state i with states[i] true"
+        for t in xrange(self.transitionStart[row], self.transitionStart[row + 1]):
+            if self.probs[t] > 0 and states[self.successors[t]]: return True
+        return False
+
+    def getQValue(self, values, discount, row):
+        """
+        Returns the Q-value of a row (a state and action) under an array of
+        state values, adding up its transitions in order.
+        """
+        successors, probs, rewards = self.successors, self.probs, self.rewards
+        q = 0
+        for t in xrange(self.transitionStart[row], self.transitionStart[row + 1]):
+            q += probs[t] * (rewards[t] + discount * values[successors[t]])
+        return q
+
+    def getBestValue(self, values, discount, i):
+        "Returns the largest Q-value of state i, or None if it has no actions"
+        best = None
+        for row in xrange(self.rowStart[i], self.rowStart[i + 1]):
+            q = self.getQValue(values, discount, row)
+            if best is None or q > best: best = q
+        return best
+
+    def sweep(self, values, discount, inPlace=False):
+        """
+        Does one value iteration sweep from an array of values and returns
+        the new values with the Bellman residual (the largest change in any
+        state's value).  The sweep is synchronous, into a new array, unless
+        inPlace is set, in which case values is updated as it goes
+        (Gauss-Seidel) and returned.  States without actions keep their
+        value.
+        """
+        if inPlace: newValues = values
+        else: newValues = array('d', values)
+        # The same sums as getBestValue, written out to save the calls
+        successors, probs, rewards = self.successors, self.probs, self.rewards
+        rowStart, transitionStart = self.rowStart, self.transitionStart
+        residual = 0.0
+        for i in xrange(self.numStates):
+            best = None
+            for row in xrange(rowStart[i], rowStart[i + 1]):
+                q = 0
+                for t in xrange(transitionStart[row], transitionStart[row + 1]):
+                    q += probs[t] * (rewards[t] + discount * values[successors[t]])
+                if best is None or q > best: best = q
+            if best is not None:
+                change = abs(best - newValues[i])
+                if change > residual: residual = change
+                newValues[i] = best
+        return newValues, residual
+
+    def getGreedyRows(self, values, discount, policy=None, tolerance=0.0):
+        """
+        Returns, for each state, the row of its best action under an array
+        of values (-1 for states without actions).  Where a given policy's
+        row is within tolerance of the best it is kept, so that rounding
+        errors don't flip between equally good actions; otherwise ties go
+        to the first action.
+        """
+        rows = array('l', [-1]) * self.numStates
+        for i in xrange(self.numStates):
+            best = None
+            for row in xrange(self.rowStart[i], self.rowStart[i + 1]):
+                q = self.getQValue(values, discount, row)
+                if best is None or q > best:
+                    best = q
+                    rows[i] = row
+            if policy is not None and policy[i] != -1 and rows[i] != policy[i]:
+                if self.getQValue(values, discount, policy[i]) >= best - tolerance:
+                    rows[i] = policy[i]
+        return rows
+
+    def policySweep(self, values, discount, policy):
+        """
+        Does one synchronous sweep of policy evaluation, where each state
+        takes the row policy gives it, and returns the new values and the
+        largest change.
+        """
+        newValues = array('d', values)
+        residual = 0.0
+        for i in xrange(self.numStates):
+            if policy[i] == -1: continue
+            q = self.getQValue(values, discount, policy[i])
+            change = abs(q - values[i])
+            if change > residual: residual = change
+            newValues[i] = q
+        return newValues, residual
+
+    def evaluatePolicy(self, discount, policy):
+        """
+        Returns the exact values of a policy (one row per state, -1 for
+        states without actions, whose value is 0) by solving
+
+          V(i) - discount * sum_j P(j | i) V(j) = sum_j P(j | i) R(i, j)
+
+        with Gaussian elimination over sparse rows.  The system has a unique
+        solution for discount < 1; with no discount the policy must reach a
+        state without actions from every state (see getProperRows), and an
+        exception is raised if it doesn't.
+        """
+        n = self.numStates
+        equations = [{i: 1.0} for i in xrange(n)]
+        constants = [0.0] * n
+        rowsWithColumn = [set([i]) for i in xrange(n)]
+        for i in xrange(n):
+            row = policy[i]
+            if row == -1: continue
+            for t in xrange(self.transitionStart[row], self.transitionStart[row + 1]):
+                j = self.successors[t]
+                prob = self.probs[t]
+                constants[i] += prob * self.rewards[t]
+                equations[i][j] = equations[i].get(j, 0.0) - discount * prob
+                rowsWithColumn[j].add(i)
+
+        # Forward elimination, leaving each equation with only later columns
+        for k in xrange(n):
+            pivotRow = equations[k]
+            pivot = pivotRow[k]
+            if abs(pivot) < SINGULAR_PIVOT:
+                raise Exception('The policy never ends from state %s, so its values are '
+                                'unbounded with a discount of %s' % (self.states[k], discount))
+            for r in rowsWithColumn[k]:
+                if r <= k: continue
+                equation = equations[r]
+                factor = equation.pop(k) / pivot
+                if factor == 0: continue
+                for c, coefficient in pivotRow.iteritems():
+                    if c == k: continue
+                    equation[c] = equation.get(c, 0.0) - factor * coefficient
+                    rowsWithColumn[c].add(r)
+                constants[r] -= factor * constants[k]
+            rowsWithColumn[k] = None
+
+        # Back substitution
+        values = array('d', [0.0]) * n
+        for k in xrange(n - 1, -1, -1):
+            total = constants[k]
+            for c, coefficient in equations[k].iteritems():
+                if c != k: total -= coefficient * values[c]
+            values[k] = total / equations[k][k]
+        return values
@@ -120,6 +120,7 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.updateZobrist()
         GameState.explored.add(self)
         GameState.explored.add(state)
         return state
@@ -243,6 +244,20 @@ class GameState:
         """
         return hash( self.data )
 
+    def getFingerprint( self ):
+        """
+        A 64-bit Zobrist hash of the state, maintained incrementally by
+        generateSuccessor (see GameStateData.getFingerprint).
+        """
+        return self.data.getFingerprint()
+
+    def getStateKey( self ):
+        """
+        The state packed into one integer, for keying Q-tables (see
+        GameStateData.getStateKey).
+        """
+        return self.data.getStateKey()
+
     def __str__( self ):
 
         return str(self.data)
@@ -361,6 +376,10 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
+            # The food grid is shared with the predecessor state and any
+            # observations of it, so copy before writing.  If the old grid
+            # has a distance field, clearing the cell carries it over to the
+            # copy with just the eaten pellet's neighbourhood recomputed
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
             state.data._foodEaten = position
@@ -523,6 +542,10 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the evaluation (non-training) games in; games in workers are not displayed'), default=1)
+    parser.add_option('--profile', dest='profile', metavar='PREFIX',
+                      help='Profile the games, writing PREFIX.prof, PREFIX.txt and PREFIX.collapsed (see profiling.py); games in workers are only timed', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -570,6 +593,8 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['profile'] = options.profile
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -627,14 +652,25 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, profile=None ):
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
 
-    for i in range( numGames ):
+    profiler = None
+    if profile:
+        import profiling
+        profiler = profiling.Profiler()
+        profiler.start()
+
+    # Training games always run here, in the one learner; with several
+    # workers only the evaluation games are farmed out
+    numSequentialGames = numGames
+    if workers > 1 and numGames - numTraining > 1: numSequentialGames = numTraining
+
+    for i in range( numSequentialGames ):
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
@@ -647,14 +683,16 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
         game.run()
         if not beQuiet: games.append(game)
+        if profiler: profiler.addGame(game)
+
+        if record: recordGame( layout, game, i )
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+    if numGames > numSequentialGames:
+        parallelGames = runGamesInParallel( layout, pacman, ghosts, numGames - numSequentialGames, catchExceptions, timeout, workers )
+        for i, game in enumerate(parallelGames):
+            if record: recordGame( layout, game, numSequentialGames + i )
+            if profiler: profiler.addGame(game)
+        games += parallelGames
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -665,8 +703,62 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
         print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
 
+    if profiler:
+        profiler.stop()
+        profiler.write(profile)
     return games
 
+def recordGame( layout, game, i ):
+    import time, cPickle
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': game.moveHistory}
+    cPickle.dump(components, f)
+    f.close()
+
+_parallelGameArgs = None
+
+def initializeWorker( args ):
+    "Keeps the arguments of runGamesInParallel in a worker process for runSeededGame"
+    global _parallelGameArgs
+    _parallelGameArgs = args
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, catchExceptions, timeout, workers ):
+    """
+    Plays numGames games over a pool of worker processes and returns them
+    in order.  Each game gets its own seed drawn from the main random
+    generator, so with a fixed seed (-f) the games are the same for any
+    number of workers above one.  (With one worker, or one game, runGames
+    plays the games here on the main random generator, so they differ.)
+    Each worker starts from a copy of the agents as they are now (e.g.
+    after training).
+
+    The returned games keep their moves, timings, agent names and final
+    state, but not their agents or display, which stay in the workers.
+    """
+    import multiprocessing
+    seeds = [random.randint(0, sys.maxint) for i in range(numGames)]
+    pool = multiprocessing.Pool(min(workers, numGames), initializeWorker,
+                                ((layout, pacman, ghosts, catchExceptions, timeout),))
+    try:
+        return pool.map(runSeededGame, seeds, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def runSeededGame( seed ):
+    "Plays one quiet game in a worker process; see runGamesInParallel"
+    import textDisplay
+    layout, pacman, ghosts, catchExceptions, timeout = _parallelGameArgs
+    random.seed(seed)
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), False, catchExceptions)
+    game.run()
+    game.agents = []
+    game.display = None
+    game.agentOutput = []
+    return game
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -680,7 +772,4 @@ if __name__ == '__main__':
     """
     args = readCommand( sys.argv[1:] ) # Get game components based on input
     runGames( **args )
-
-    # import cProfile
-    # cProfile.run("runGames( **args )")
     pass
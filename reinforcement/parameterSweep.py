@@ -0,0 +1,186 @@
+# parameterSweep.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Solves a gridworld for every combination of discount, noise and living
+reward over a pool of processes, and writes a table of the resulting
+policies, the values of the start state and the paths the policies take.
+The table can then be searched for a behaviour, such as the policies that
+reach a given exit without passing a given square, as the analysis
+questions ask for.
+
+  > python parameterSweep.py -g DiscountGrid -d 0.1:0.9:9 -n 0:0.4:5 -r -2:1:13 -o sweep.txt
+  > python parameterSweep.py --table sweep.txt --visits "(4,2)" --avoids "(0,0)"
+
+Policies are found the way the autograder's GridPolicyTest finds them:
+ValueIterationAgent with its default 100 iterations, and paths are followed
+without noise from the start state.  With a tolerance (-t) each solve
+instead stops once its values have converged, starting from the values of
+the configuration before it, which is much faster when the parameters are
+finely spaced.
+"""
+
+import sys
+import optparse
+import gridworld
+import valueIterationAgents
+from reinforcementTestClasses import followPath
+
+ACTION_LETTERS = {'north': 'N', 'south': 'S', 'east': 'E', 'west': 'W', 'exit': 'X', None: '.'}
+
+def parseRange(text):
+    """
+    Reads a range of parameter values, either a comma separated list
+    ("0.1,0.5,0.9") or start:stop:count for count evenly spaced values
+    from start to stop ("0:1:11").
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        start, stop, count = float(start), float(stop), int(count)
+        if count == 1: return [start]
+        return [start + (stop - start) * i / (count - 1) for i in range(count)]
+    return [float(value) for value in text.split(',')]
+
+def policyString(grid, policy):
+    "The policy as rows of action letters, top row first, separated by /"
+    rows = []
+    for y in range(grid.grid.height - 1, -1, -1):
+        rows.append(''.join([ACTION_LETTERS[policy.get((x, y))] for x in range(grid.grid.width)]))
+    return '/'.join(rows)
+
+def solveConfigurations(gridName, configurations, iterations=100, tolerance=None):
+    """
+    Solves the named grid (as in gridworld.py's -g option) for each
+    (discount, noise, livingReward) in turn and returns a row per
+    configuration: the parameters, the value of the start state, the path
+    the policy follows and the policy itself (see policyString).
+    """
+    mdp = getattr(gridworld, 'get' + gridName)()
+    start = mdp.getStartState()
+    rows = []
+    agent = None
+    for discount, noise, livingReward in configurations:
+        mdp.setNoise(noise)
+        mdp.setLivingReward(livingReward)
+        initialValues = None
+        if tolerance is not None and agent is not None and agent.discount == discount:
+            initialValues = agent.values
+        agent = valueIterationAgents.ValueIterationAgent(mdp, discount, iterations, tolerance,
+                                                         initialValues = initialValues)
+        policy = {}
+        for state in mdp.getStates():
+            policy[state] = agent.computeActionFromValues(state)
+        path = followPath(policy, start)
+        rows.append((discount, noise, livingReward, agent.getValue(start), path, policyString(mdp, policy)))
+    return rows
+
+_sweepArgs = None
+
+def _solveChunk(configurations):
+    gridName, iterations, tolerance = _sweepArgs
+    return solveConfigurations(gridName, configurations, iterations, tolerance)
+
+def sweep(gridName, discounts, noises, livingRewards, iterations=100, workers=1, tolerance=None):
+    """
+    Solves the grid for every combination of the given parameters, over a
+    pool of worker processes if workers > 1, and returns the rows of
+    solveConfigurations in the order of the combinations.
+    """
+    configurations = [(d, n, r) for d in discounts for n in noises for r in livingRewards]
+    if workers <= 1 or len(configurations) <= 1:
+        return solveConfigurations(gridName, configurations, iterations, tolerance)
+
+    import multiprocessing
+    global _sweepArgs
+    _sweepArgs = (gridName, iterations, tolerance)
+    # A few chunks per worker keeps them all busy to the end
+    size = max(1, len(configurations) / (workers * 4))
+    chunks = [configurations[i:i + size] for i in range(0, len(configurations), size)]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.map(_solveChunk, chunks, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return [row for chunk in results for row in chunk]
+
+def writeTable(rows, out):
+    "Writes the rows as tab separated text with a header line"
+    out.write('discount\tnoise\tlivingReward\tstartValue\tpath\tpolicy\n')
+    for discount, noise, livingReward, startValue, path, policy in rows:
+        out.write('%r\t%r\t%r\t%r\t%s\t%s\n' % (discount, noise, livingReward, startValue, ' '.join(path), policy))
+
+def readTable(lines):
+    "Reads back the rows of a table written by writeTable"
+    rows = []
+    for line in lines[1:]:
+        discount, noise, livingReward, startValue, path, policy = line.rstrip('\n').split('\t')
+        rows.append((float(discount), float(noise), float(livingReward), float(startValue), path.split(), policy))
+    return rows
+
+def searchTable(rows, visits=None, avoids=None):
+    """
+    Returns the rows whose path passes through visits and not through
+    avoids, each given as GridPolicyTest writes them: "(x,y)" or
+    "TERMINAL_STATE".
+    """
+    return [row for row in rows
+            if (visits is None or visits in row[4]) and (avoids is None or avoids not in row[4])]
+
+def parseOptions(argv):
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('-g', '--grid', dest='grid', default='DiscountGrid',
+                      help='Grid to sweep (as in gridworld.py, default %default)')
+    parser.add_option('-d', '--discounts', dest='discounts', default='0.1:0.9:9',
+                      help='Discounts, as a list a,b,c or start:stop:count (default %default)')
+    parser.add_option('-n', '--noises', dest='noises', default='0:0.4:5',
+                      help='Noises, as for the discounts (default %default)')
+    parser.add_option('-r', '--livingRewards', dest='livingRewards', default='-2:1:7',
+                      help='Living rewards, as for the discounts (default %default)')
+    parser.add_option('-i', '--iterations', dest='iterations', type='int', default=100,
+                      help='Rounds of value iteration per configuration (default %default)')
+    parser.add_option('-t', '--tolerance', dest='tolerance', type='float', default=None,
+                      help='Stop each solve once no value changes by this much, warm-starting it from the last')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=1,
+                      help='Number of processes to solve in (default %default)')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='File to write the table to (default: standard output)')
+    parser.add_option('--table', dest='table', default=None,
+                      help='Search a table written earlier instead of solving')
+    parser.add_option('--visits', dest='visits', default=None,
+                      help='Only keep policies whose path visits this state, e.g. "(4,2)"')
+    parser.add_option('--avoids', dest='avoids', default=None,
+                      help='Only keep policies whose path does not visit this state')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = parseOptions(sys.argv[1:])
+    if options.table:
+        f = open(options.table)
+        try: rows = readTable(f.readlines())
+        finally: f.close()
+    else:
+        rows = sweep(options.grid, parseRange(options.discounts), parseRange(options.noises),
+                     parseRange(options.livingRewards), options.iterations, options.workers,
+                     options.tolerance)
+    rows = searchTable(rows, options.visits, options.avoids)
+    if options.output:
+        f = open(options.output, 'w')
+        try: writeTable(rows, f)
+        finally: f.close()
+    else:
+        writeTable(rows, sys.stdout)
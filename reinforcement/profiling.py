@@ -0,0 +1,159 @@
+# profiling.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+The --profile option of pacman.py, busters.py and gridworld.py.  This file
+is the same in the reinforcement and tracking projects.
+
+Profiling a run with --profile PREFIX writes:
+
+  PREFIX.prof        the cProfile statistics, for pstats or a viewer
+  PREFIX.txt         the functions by cumulative time, and the time each
+                     agent took per move (percentiles over all its moves)
+  PREFIX.collapsed   sampled call stacks, one "caller;callee count" line per
+                     distinct stack, as flamegraph.pl and speedscope read them
+
+The stacks are sampled on SIGPROF (every SAMPLE_INTERVAL seconds of CPU
+time) where the platform has it, and the file is left empty where it does
+not.  Samples are taken while cProfile runs, so they include its overhead.
+"""
+
+import os
+import math
+import time
+import signal
+import pstats
+import cProfile
+
+SAMPLE_INTERVAL = 0.005
+PERCENTILES = [50, 90, 99]
+
+class StackSampler:
+    """
+    Counts the call stacks the program is in, sampled on a CPU time timer.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self.oldHandler = None
+
+    def start(self):
+        if not hasattr(signal, 'setitimer'): return
+        self.oldHandler = signal.signal(signal.SIGPROF, self.sample)
+        # Restart system calls the timer interrupts rather than failing them
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        if not hasattr(signal, 'setitimer'): return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.oldHandler or signal.SIG_DFL)
+
+    def sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        names.reverse()
+        stack = ';'.join(names)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def write(self, out):
+        for stack in sorted(self.stacks):
+            out.write('%s %d\n' % (stack, self.stacks[stack]))
+
+class Profiler:
+    """
+    Profiles everything between start() and stop() with cProfile and the
+    stack sampler, and collects the times of the agents' moves:
+
+      profiler = Profiler()
+      profiler.start()
+      for i in range(numGames):
+          game.run()
+          profiler.addGame(game)
+      profiler.stop()
+      profiler.write('pacman')
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler()
+        self.elapsed = 0.0
+        self.moveTimes = {}
+
+    def start(self):
+        self.startTime = time.time()
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+        self.elapsed += time.time() - self.startTime
+
+    def addGame(self, game):
+        "Adds the times of each agent's moves in a finished game"
+        for index, times in enumerate(game.agentMoveTimes):
+            name = 'Agent %d (%s)' % (index, game.agentNames[index])
+            self.getMoveTimes(name).extend(times)
+
+    def getMoveTimes(self, name):
+        "The list of the times of the named agent's moves, to add to"
+        return self.moveTimes.setdefault(name, [])
+
+    def write(self, prefix, numFunctions=40):
+        "Writes the files described at the top of this module"
+        self.profile.dump_stats(prefix + '.prof')
+
+        f = open(prefix + '.txt', 'w')
+        try:
+            f.write('Profiled %.2f seconds\n\n' % self.elapsed)
+            if self.moveTimes: writeMoveTimes(self.moveTimes, f)
+            stats = pstats.Stats(prefix + '.prof', stream=f)
+            stats.sort_stats('cumulative').print_stats(numFunctions)
+        finally: f.close()
+
+        f = open(prefix + '.collapsed', 'w')
+        try: self.sampler.write(f)
+        finally: f.close()
+        print 'Wrote the profile to %s.prof, %s.txt and %s.collapsed' % (prefix, prefix, prefix)
+
+def timedCalls(function, times):
+    "Wraps function so that the time of every call is appended to times"
+    def timed(*args):
+        start = time.time()
+        try: return function(*args)
+        finally: times.append(time.time() - start)
+    return timed
+
+def percentile(sortedValues, percent):
+    "The value percent% of the way through the (non-empty) sorted values, by nearest rank"
+    rank = int(math.ceil(percent / 100.0 * len(sortedValues))) - 1
+    return sortedValues[max(0, min(len(sortedValues) - 1, rank))]
+
+def writeMoveTimes(moveTimes, out):
+    "Writes a table of the percentiles of each agent's move times, in milliseconds"
+    out.write('%-36s %8s %10s' % ('Time per move (ms)', 'moves', 'mean'))
+    for percent in PERCENTILES: out.write(' %9s' % ('p%d' % percent))
+    out.write(' %9s\n' % 'max')
+    for name in sorted(moveTimes):
+        times = sorted(moveTimes[name])
+        if not times: continue
+        out.write('%-36s %8d %10.3f' % (name, len(times), 1000 * sum(times) / len(times)))
+        for percent in PERCENTILES: out.write(' %9.3f' % (1000 * percentile(times, percent)))
+        out.write(' %9.3f\n' % (1000 * times[-1]))
+    out.write('\n')
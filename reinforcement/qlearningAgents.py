@@ -16,7 +16,67 @@ from game import *
 from learningAgents import ReinforcementAgent
 from featureExtractors import *
 
-import random,util,math
+import random,util,math,operator
+from itertools import imap
+from array import array
+
+class QTable:
+    """
+    Q-values in one flat array of floats, for small state spaces such as
+    the gridworlds and the crawler.  Each state gets a row the first time
+    it is seen: the legal actions there (from actionFn, which must always
+    give the same actions for a state) and a Q-value for each of them,
+    stored next to each other from rowStart[row].  Unseen Q-values are 0.
+    States are looked up by keyFn(state) if a keyFn is given.
+    """
+
+    def __init__(self, actionFn, keyFn=None):
+        self.actionFn = actionFn
+        self.keyFn = keyFn
+        self.rows = {}
+        self.rowStart = []
+        self.rowActions = []
+        self.values = array('d')
+
+    def getRow(self, state):
+        "The row of the state, added if it is new"
+        key = state
+        if self.keyFn is not None: key = self.keyFn(state)
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.rowStart)
+            actions = tuple(self.actionFn(state))
+            self.rows[key] = row
+            self.rowStart.append(len(self.values))
+            self.rowActions.append(actions)
+            self.values.extend([0.0] * len(actions))
+        return row
+
+    def getActions(self, state):
+        return self.rowActions[self.getRow(state)]
+
+    def getColumn(self, row, action):
+        try:
+            return self.rowStart[row] + self.rowActions[row].index(action)
+        except ValueError:
+            raise Exception("Illegal Action")
+
+    def getQValue(self, state, action):
+        row = self.getRow(state)
+        if not self.rowActions[row]: return 0.0
+        return self.values[self.getColumn(row, action)]
+
+    def getQValues(self, state):
+        "The legal actions in state and the row of their Q-values"
+        row = self.getRow(state)
+        start = self.rowStart[row]
+        actions = self.rowActions[row]
+        return actions, self.values[start:start + len(actions)]
+
+    def update(self, state, action, target, alpha):
+        "Moves Q(state, action) a fraction alpha of the way to target"
+        column = self.getColumn(self.getRow(state), action)
+        self.values[column] = (1 - alpha) * self.values[column] + alpha * target
 
 class QLearningAgent(ReinforcementAgent):
     """
@@ -38,14 +98,24 @@ class QLearningAgent(ReinforcementAgent):
         - self.getLegalActions(state)
           which returns legal actions for a state
     """
-    def __init__(self, **args):
-        "You can initialize Q-values here..."
+    def __init__(self, arrayTable=False, **args):
+        """
+        With arrayTable, the Q-values are kept in a QTable instead of the
+        dict of Counters, which is faster when the states are few.
+        """
         ReinforcementAgent.__init__(self, **args)
 
         "*** YOUR CODE HERE ***"
         # A dict of util.Counter to store q values mapping state to
         # Counter's mapping actions to qValue
         self.qValues = {}
+        self.qTable = None
+        if arrayTable and arrayTable != 'False':
+            self.qTable = QTable(self.actionFn, self.getStateKey)
+
+    def getStateKey(self, state):
+        "The key the Q-values of state are stored under: here the state itself"
+        return state
 
     def getQValue(self, state, action):
         """
@@ -57,9 +127,12 @@ class QLearningAgent(ReinforcementAgent):
           Raise exception if the action is not legal at the state.
         """
         "*** YOUR CODE HERE ***"
+        if self.qTable is not None:
+            return self.qTable.getQValue(state, action)
+        key = self.getStateKey(state)
         # If a state has not been seen yet
-        if state not in self.qValues:
-            self.qValues[state] = util.Counter()
+        if key not in self.qValues:
+            self.qValues[key] = util.Counter()
             legalActions = self.getLegalActions(state)
             if (not legalActions):
                 # terminal state
@@ -68,22 +141,21 @@ class QLearningAgent(ReinforcementAgent):
             if action not in legalActions:
                 raise Exception("Illegal Action")
             for la in legalActions:
-                self.qValues[state][la] = 0.0
-        return self.qValues[state][action]
+                self.qValues[key][la] = 0.0
+        return self.qValues[key][action]
 
     def computeValueFromQValues(self, state):
         """
           Returns max_action Q(state,action).
           where the max is over legal actions.
           If there're no legal actions, return 0.0.
+          Unlike computeActionFromQValues, this makes no random draw.
         """
         "*** YOUR CODE HERE ***"
-        maxAction = self.computeActionFromQValues(state)
-        # print maxAction
-        if maxAction is None:
+        legalActions, qValues = self.getQValues(state)
+        if not legalActions:
             return 0.0
-        else:
-            return self.getQValue(state, maxAction)
+        return max(qValues)
 
     def computeActionFromQValues(self, state):
         """
@@ -95,25 +167,41 @@ class QLearningAgent(ReinforcementAgent):
           Break tie by randomly choosing from best actions.
         """
         "*** YOUR CODE HERE ***"
+        return self.computeBestActionAndValue(state)[0]
+
+    def getQValues(self, state):
+        """
+          Returns the legal actions in state and a list of their Q-values,
+          read from the table in one go (an unseen state is added with all
+          its Q-values 0).
+        """
+        if self.qTable is not None:
+            return self.qTable.getQValues(state)
         legalActions = self.getLegalActions(state)
         if not legalActions:
-            return None
+            return legalActions, []
+        key = self.getStateKey(state)
+        stateValues = self.qValues.get(key)
+        if stateValues is None:
+            stateValues = self.qValues[key] = util.Counter()
+            for action in legalActions:
+                stateValues[action] = 0.0
+        return legalActions, [stateValues[action] for action in legalActions]
 
-        # Find the best action
-        maxAction = None
-        for action in legalActions:
-            if maxAction is None or self.getQValue(state, action)>self.getQValue(state, maxAction):
-                maxAction = action
-        maxVal = self.getQValue(state, maxAction)
-        maxActions = []
-        # check if there are multiple good ones
-        for action in legalActions:
-            if self.getQValue(state, action)==maxVal:
-                maxActions.append(action)
+    def computeBestActionAndValue(self, state):
+        """
+          Returns the greedy action in state and its Q-value from a single
+          pass over the Q-values of the legal actions; (None, 0.0) if there
+          are none.  Ties are broken at random.
+        """
+        legalActions, qValues = self.getQValues(state)
+        if not legalActions:
+            return None, 0.0
+        maxVal = max(qValues)
+        maxActions = [action for action, q in zip(legalActions, qValues) if q == maxVal]
         if len(maxActions)>1:
-            return random.choice(maxActions)
-        else:
-            return maxAction
+            return random.choice(maxActions), maxVal
+        return maxActions[0], maxVal
 
     def getAction(self, state):
         """
@@ -123,7 +211,10 @@ class QLearningAgent(ReinforcementAgent):
           with 1-epsilon probability we choose the optimal action.
         """
         # Pick Action
-        legalActions = self.getLegalActions(state)
+        if self.qTable is not None:
+            legalActions = self.qTable.getActions(state)
+        else:
+            legalActions = self.getLegalActions(state)
         if not legalActions:
             return None
 
@@ -144,13 +235,17 @@ class QLearningAgent(ReinforcementAgent):
         """
         "*** YOUR CODE HERE ***"
         sample = reward + self.discount * self.computeValueFromQValues(nextState)
-        self.computeValueFromQValues(nextState)
-
-        if state not in self.qValues:
-            self.qValues[state] = util.Counter()
-        if action not in self.qValues[state]:
-            self.qValues[state][action] = 0.0
-        self.qValues[state][action] = (1-self.alpha) * self.getQValue(state, action) + self.alpha * sample
+        if self.qTable is not None:
+            self.qTable.update(state, action, sample, self.alpha)
+            return
+        key = self.getStateKey(state)
+        if key not in self.qValues:
+            # initialize all legal actions
+            self.getQValues(state)
+        stateValues = self.qValues.get(key)
+        if stateValues is None or action not in stateValues:
+            raise Exception("Illegal Action")
+        stateValues[action] = (1-self.alpha) * stateValues[action] + self.alpha * sample
 
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
@@ -159,6 +254,121 @@ class QLearningAgent(ReinforcementAgent):
         return self.computeValueFromQValues(state)
 
 
+class SarsaLambdaAgent(QLearningAgent):
+    """
+      SARSA(lambda): learns Q-values of the epsilon-greedy policy it follows,
+      passing each TD error back along an eligibility trace of the state
+      action pairs visited, so that a reward reaches the whole path to it in
+      one step instead of one state per episode.
+
+      The trace is sparse: a dict from Q-table entry to eligibility that
+      decays by gamma * lambda every step and drops entries once they fall
+      below traceThreshold, so each update costs as much as the number of
+      recently visited pairs.  Traces are replacing (a revisited pair goes
+      back to 1) and are cleared at the start of each episode.
+
+      The TD error needs the next action, so update chooses it in advance
+      and getAction returns it when asked about that state.  The actions
+      taken must come from getAction: update raises an exception if it is
+      given an action other than the one it chose.
+    """
+    def __init__(self, traceDecay=0.9, traceThreshold=0.001, **args):
+        QLearningAgent.__init__(self, **args)
+        if self.replayBuffer is not None:
+            raise Exception('Eligibility traces cannot be used with experience replay')
+        self.traceDecay = float(traceDecay)
+        self.traceThreshold = float(traceThreshold)
+        self.traces = {}
+        self.plannedKey = None
+        self.plannedAction = None
+
+    def startEpisode(self):
+        QLearningAgent.startEpisode(self)
+        self.traces = {}
+        self.plannedKey = None
+
+    def getAction(self, state):
+        if self.plannedKey is not None and self.getStateKey(state) == self.plannedKey:
+            self.plannedKey = None
+            return self.plannedAction
+        return QLearningAgent.getAction(self, state)
+
+    def chooseNextAction(self, state):
+        """
+          Returns the epsilon-greedy action in state (None if there is none),
+          its Q-value and the greatest Q-value there.
+        """
+        legalActions, qValues = self.getQValues(state)
+        if not legalActions:
+            return None, 0.0, 0.0
+        action, maxValue = self.computeBestActionAndValue(state)
+        if not util.flipCoin(self.epsilon):
+            return action, maxValue, maxValue
+        index = random.randrange(len(legalActions))
+        return legalActions[index], qValues[index], maxValue
+
+    def getTargetValue(self, nextValue, maxValue):
+        "The value of the next state the TD error is taken against"
+        return nextValue
+
+    def keepTraces(self, nextValue, maxValue):
+        "Whether the traces carry on to the next step"
+        return True
+
+    def getTraceEntry(self, state, action):
+        "The Q-table entry the trace of (state, action) refers to"
+        self.getQValue(state, action) # Adds the state if it is new
+        if self.qTable is not None:
+            return self.qTable.getColumn(self.qTable.getRow(state), action)
+        return self.getStateKey(state), action
+
+    def addToQValue(self, entry, amount):
+        if self.qTable is not None:
+            self.qTable.values[entry] += amount
+        else:
+            key, action = entry
+            self.qValues[key][action] += amount
+
+    def update(self, state, action, nextState, reward):
+        if self.plannedKey is not None and action != self.plannedAction and self.getStateKey(state) == self.plannedKey:
+            raise Exception('%s learned from %s as the next action in %s, but %s was taken; '
+                            'its actions must come from getAction' % (self.__class__.__name__, self.plannedAction, state, action))
+        nextAction, nextValue, maxValue = self.chooseNextAction(nextState)
+        error = reward + self.discount * self.getTargetValue(nextValue, maxValue) - self.getQValue(state, action)
+        self.traces[self.getTraceEntry(state, action)] = 1.0
+
+        step = self.alpha * error
+        decay = self.discount * self.traceDecay
+        traces = {}
+        for entry, eligibility in self.traces.iteritems():
+            self.addToQValue(entry, step * eligibility)
+            eligibility *= decay
+            if eligibility >= self.traceThreshold:
+                traces[entry] = eligibility
+        if not self.keepTraces(nextValue, maxValue): traces = {}
+        self.traces = traces
+
+        if nextAction is not None:
+            self.plannedKey = self.getStateKey(nextState)
+            self.plannedAction = nextAction
+        else:
+            self.plannedKey = None
+
+
+class QLambdaAgent(SarsaLambdaAgent):
+    """
+      Watkins's Q(lambda): like SarsaLambdaAgent, but the TD error is taken
+      against the greedy value of the next state, so it learns the optimal
+      Q-values as Q-learning does.  The trace only follows the greedy path,
+      so it is cut whenever an exploratory action is chosen.
+    """
+    def getTargetValue(self, nextValue, maxValue):
+        return maxValue
+
+    def keepTraces(self, nextValue, maxValue):
+        return nextValue == maxValue
+
+
 class PacmanQAgent(QLearningAgent):
     "Exactly the same as QLearningAgent, but with different default parameters"
 
@@ -198,6 +408,14 @@ class PacmanQAgent(QLearningAgent):
         self.doAction(state,action)
         return action
 
+    def getStateKey(self, state):
+        """
+        Q-values are stored under the state packed into an integer (see
+        GameStateData.getStateKey), so the table does not keep whole game
+        states alive.
+        """
+        return state.getStateKey()
+
 
 class ApproximateQAgent(PacmanQAgent):
     """
@@ -210,10 +428,54 @@ class ApproximateQAgent(PacmanQAgent):
     def __init__(self, extractor='IdentityExtractor', **args):
         self.featExtractor = util.lookup(extractor, globals())()
         PacmanQAgent.__init__(self, **args)
-        self.weights = util.Counter()
+        # Extractors with a fixed set of features give them as arrays
+        # indexed by their registry, and the weights are then an array too
+        self.registry = self.featExtractor.registry
+        if self.registry is None:
+            self.weights = util.Counter()
+        else:
+            self.weights = self.registry.newVector()
+        # The features of every legal action of the last state looked at;
+        # see getFeaturesForAllActions
+        self.featureState = None
+        self.stateFeatures = None
 
     def getWeights(self):
-        return self.weights
+        "Returns the weights as a Counter from feature to weight"
+        if self.registry is None:
+            return self.weights
+        return self.registry.toCounter(self.weights)
+
+    def getFeaturesForAllActions(self, state):
+        """
+          Returns a dict from each legal action of state to its features.
+          The same state is usually asked about several times in a row
+          (the action is chosen in it, then the transition out of it is
+          learned from), so the features of the last state are kept.
+        """
+        if state is not self.featureState:
+            if self.registry is None:
+                self.stateFeatures = self.featExtractor.getFeaturesForAllActions(state, self.getLegalActions(state))
+            else:
+                self.stateFeatures = self.featExtractor.getFeatureVectorsForAllActions(state, self.getLegalActions(state))
+            self.featureState = state
+        return self.stateFeatures
+
+    def getFeatures(self, state, action):
+        if state is self.featureState and action in self.stateFeatures:
+            return self.stateFeatures[action]
+        if self.registry is None:
+            return self.featExtractor.getFeatures(state, action)
+        return self.featExtractor.getFeatureVector(state, action)
+
+    def dotProduct(self, features):
+        "The weighted sum of features, as given by getFeatures"
+        if self.registry is None:
+            return features * self.weights
+        # The weights and features can differ in length if the registry has
+        # grown since one was made (see FeatureRegistry); imap stops at the
+        # shorter, since the missing entries are zeros
+        return sum(imap(operator.mul, features, self.weights))
 
     def getQValue(self, state, action):
         """
@@ -221,20 +483,38 @@ class ApproximateQAgent(PacmanQAgent):
           where * is the dotProduct operator
         """
         "*** YOUR CODE HERE ***"
-        features = self.featExtractor.getFeatures(state, action)
-        return features * self.weights
+        features = self.getFeatures(state, action)
+        return self.dotProduct(features)
+
+    def getQValues(self, state):
+        "The legal actions and their Q-values, from a single feature extraction"
+        legalActions = self.getLegalActions(state)
+        if not legalActions:
+            return legalActions, []
+        allFeatures = self.getFeaturesForAllActions(state)
+        return legalActions, [self.dotProduct(allFeatures[action]) for action in legalActions]
 
     def update(self, state, action, nextState, reward):
         """
            Update the weights (in batch) base on the transition observed.
         """
         "*** YOUR CODE HERE ***"
-        oldWeights = self.weights.copy()
+        features = self.getFeatures(state, action)
         nextStateValue = self.getValue(nextState)
-        difference = (reward  + self.discount * nextStateValue) - self.getQValue(state, action)
-        features = self.featExtractor.getFeatures(state, action)
-        for feature in features:
-            self.weights[feature] = oldWeights[feature] + self.alpha * difference * features[feature]
+        difference = (reward  + self.discount * nextStateValue) - self.dotProduct(features)
+        # The difference is worked out from the old weights before any of
+        # them change, and each active feature's weight is written once, so
+        # updating in place touches only those weights but is still a
+        # batch update
+        if self.registry is not None:
+            if len(features) > len(self.weights):
+                self.weights.extend(self.registry.newVector()[len(self.weights):])
+            for index, value in enumerate(features):
+                if value:
+                    self.weights[index] = self.weights[index] + self.alpha * difference * value
+        else:
+            for feature, value in features.items():
+                self.weights[feature] = self.weights[feature] + self.alpha * difference * value
 
     def final(self, state):
         "Called at the end of each game."
@@ -245,4 +525,4 @@ class ApproximateQAgent(PacmanQAgent):
         if self.episodesSoFar == self.numTraining:
             # you might want to print your weights here for debugging
             "*** YOUR CODE HERE ***"
-            print self.weights
+            print self.getWeights()
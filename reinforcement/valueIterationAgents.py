@@ -14,6 +14,9 @@
 
 import mdp, util
 from util import PriorityQueue, Counter
+from array import array
+import heapq
+import copy
 
 from learningAgents import ValueEstimationAgent
 
@@ -25,8 +28,28 @@ class ValueIterationAgent(ValueEstimationAgent):
         (see mdp.py) on initialization and runs value iteration
         for a given number of iterations using the supplied
         discount factor.
+
+        With a tolerance it stops early, once no value changes by
+        tolerance or more in a sweep; with inPlace it updates the
+        values as it sweeps (Gauss-Seidel) rather than from a copy.
+        Afterwards iterationsUsed is the number of sweeps run and
+        residual the largest change in the last one.
+
+        initialValues (a dict from state to value, such as the values of
+        an agent solved for nearby parameters) warm-starts the solve in
+        place of all zeros.  With followChanges the agent listens for
+        changes to the MDP (see MarkovDecisionProcess.addChangeListener)
+        and solves again from its current values whenever one is made.
+        A warm-started solve without a tolerance stops once no value
+        changes by warmStartTolerance, since running the full number of
+        iterations from values that are nearly right would save nothing.
+        With keepHistory the values after every sweep are kept, and
+        getSnapshot(k) gives the agent as it was after k of them.
     """
-    def __init__(self, mdp, discount = 0.9, iterations = 100):
+    warmStartTolerance = 1e-6
+
+    def __init__(self, mdp, discount = 0.9, iterations = 100, tolerance = None, inPlace = False,
+                 initialValues = None, followChanges = False, keepHistory = False):
         """
           Your value iteration agent should take an mdp on
           construction, run the indicated number of iterations
@@ -42,34 +65,111 @@ class ValueIterationAgent(ValueEstimationAgent):
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
+        self.tolerance = tolerance
+        self.inPlace = inPlace
         self.values = util.Counter() # A Counter is a dict with default 0
+        self.initialValues = initialValues
+        self.keepHistory = keepHistory
+        self.history = None
+        self.iterationsUsed = 0
+        self.backups = 0
+        self.residual = None
 
         # Write value iteration code here
         """
         Value iteration implementation (batch version). First copy the old
-        values and then update.
+        values and then update.  The sweeps run over the arrays of a
+        CompiledMDP (see mdp.py), which add up each Q-value the same way as
+        computeQValueFromValues, and the results are copied back into
+        self.values.
         """
         "*** YOUR CODE HERE ***"
         statelist = self.mdp.getStates()
         for state in statelist:
             self.values[state] = 0
-        for k in range(iterations):
-            oldValues = Counter(self.values)
-            for state in statelist:
-                possibleActions = self.mdp.getPossibleActions(state)
-                # use a priority queue to find the max of reward
-                actionRewards = PriorityQueue()
-                if possibleActions == ():
-                    continue
-                for action in possibleActions:
-                    reward = 0
-                    statesProbs = self.mdp.getTransitionStatesAndProbs(state, action)
-                    for nextState, prob in statesProbs:
-                        reward += prob*(self.mdp.getReward(state,action,nextState)
-                                        +self.discount*oldValues[nextState])
-                    actionRewards.push(reward, -reward)
-                maxRewards = actionRewards.pop()
-                self.values[state] = maxRewards
+        self.compiledMDP = self.compileMDP()
+        self.runValueIteration()
+        if followChanges:
+            self.mdp.addChangeListener(self.mdpChanged)
+
+    def mdpChanged(self, mdp, change):
+        "Called by the MDP when followChanges is set and one of its parameters changes"
+        self.resolve()
+
+    def resolve(self):
+        """
+          Solves the MDP again (after its parameters have changed), starting
+          from the current values.
+        """
+        self.initialValues = util.Counter(self.values)
+        self.iterationsUsed = 0
+        self.backups = 0
+        self.residual = None
+        self.compiledMDP = self.compileMDP()
+        self.runValueIteration()
+
+    def getInitialValues(self):
+        """
+          Returns the array of values (indexed as in self.compiledMDP) that
+          the solve starts from: the initial values for states that have
+          actions and 0 everywhere else.
+        """
+        compiled = self.compiledMDP
+        values = array('d', [0.0]) * compiled.numStates
+        if self.initialValues is not None:
+            for i, state in enumerate(compiled.states):
+                if compiled.actions[i] and state in self.initialValues:
+                    values[i] = self.initialValues[state]
+        return values
+
+    def runValueIteration(self):
+        "Runs the sweeps and sets self.values, iterationsUsed, backups and residual"
+        values = self.getInitialValues()
+        statesWithActions = len([actions for actions in self.compiledMDP.actions if actions])
+        tolerance = self.tolerance
+        if tolerance is None and self.initialValues is not None:
+            tolerance = self.warmStartTolerance
+        if self.keepHistory: self.history = [array('d', values)]
+        for k in range(self.iterations):
+            values, self.residual = self.compiledMDP.sweep(values, self.discount, self.inPlace)
+            self.iterationsUsed += 1
+            if self.keepHistory: self.history.append(array('d', values))
+            self.backups += statesWithActions
+            if tolerance is not None and self.residual < tolerance:
+                break
+        if self.iterations > 0 or self.initialValues is not None:
+            self.setValues(values)
+
+    def getSnapshot(self, k):
+        """
+          Returns a copy of the agent with the values it had after k sweeps,
+          for 0 <= k <= iterationsUsed; the agent must have been made with
+          keepHistory.  The copy gives the same values and policy as a new
+          agent run for k iterations, without running them again.
+        """
+        snapshot = copy.copy(self)
+        snapshot.values = util.Counter(self.values)
+        snapshot.iterationsUsed = k
+        if k > 0 or self.initialValues is not None:
+            snapshot.setValues(self.history[k])
+        else:
+            for state in snapshot.values:
+                snapshot.values[state] = 0
+        return snapshot
+
+    def compileMDP(self):
+        "Returns the CompiledMDP of self.mdp for the sweeps to run over"
+        return mdp.CompiledMDP(self.mdp)
+
+    def setValues(self, values):
+        """
+          Copies an array of values (indexed as in self.compiledMDP) into
+          self.values.  States without actions keep their value of 0.
+        """
+        compiled = self.compiledMDP
+        for i, state in enumerate(compiled.states):
+            if compiled.actions[i]:
+                self.values[state] = values[i]
 
     def getValue(self, state):
         """
@@ -119,3 +219,161 @@ class ValueIterationAgent(ValueEstimationAgent):
 
     def getQValue(self, state, action):
         return self.computeQValueFromValues(state, action)
+
+
+class PrioritizedSweepingValueIterationAgent(ValueIterationAgent):
+    """
+        A PrioritizedSweepingValueIterationAgent backs up one state at a
+        time instead of sweeping over all of them: always the state whose
+        value is furthest from its Bellman backup (its error), and after
+        each backup it rechecks only the states that can lead to the one
+        that changed.  States whose error is theta or less are left alone,
+        so on mazes where rewards are sparse most states are backed up
+        only a few times.
+
+        It goes on until no state has an error above theta, or until it
+        has done maxBackups backups if that is given.  There are no sweeps,
+        so there is no number of iterations.  Afterwards iterationsUsed and
+        backups are the number of backups done and residual is the largest
+        error left in the queue.
+    """
+    def __init__(self, mdp, discount = 0.9, maxBackups = None, theta = 1e-5,
+                 initialValues = None, followChanges = False):
+        self.maxBackups = maxBackups
+        self.theta = theta
+        ValueIterationAgent.__init__(self, mdp, discount, 0,
+                                     initialValues = initialValues, followChanges = followChanges)
+
+    def runValueIteration(self):
+        compiled = self.compiledMDP
+        values = self.getInitialValues()
+        predecessors = compiled.getPredecessors()
+
+        # error[i] is the priority state i is queued with, or 0 if it isn't
+        # queued; older heap entries for a state no longer match its error
+        # and are skipped when they come up
+        error = array('d', [0.0]) * compiled.numStates
+        queue = []
+        for i in range(compiled.numStates):
+            self.queueIfInError(values, error, queue, i)
+
+        while queue and (self.maxBackups is None or self.backups < self.maxBackups):
+            priority, i = heapq.heappop(queue)
+            if -priority != error[i]: continue
+            error[i] = 0.0
+            values[i] = compiled.getBestValue(values, self.discount, i)
+            self.backups += 1
+            for p in predecessors[i]:
+                self.queueIfInError(values, error, queue, p)
+
+        self.iterationsUsed = self.backups
+        self.residual = max(error) if error else 0.0
+        self.setValues(values)
+
+    def queueIfInError(self, values, error, queue, i):
+        "Queues state i by its error if that is more than theta, and unqueues it otherwise"
+        best = self.compiledMDP.getBestValue(values, self.discount, i)
+        if best is None: return
+        diff = abs(values[i] - best)
+        if diff > self.theta:
+            if diff != error[i]:
+                error[i] = diff
+                heapq.heappush(queue, (-diff, i))
+        else:
+            error[i] = 0.0
+
+class PolicyIterationAgent(ValueIterationAgent):
+    """
+        A PolicyIterationAgent starts from a policy that reaches an exit
+        from every state it can (see CompiledMDP.getProperRows), or from
+        the greedy policy for the initial values if it is given some.  It
+        alternates evaluating the policy exactly (solving a linear system
+        for its values) with making it greedy with respect to those values,
+        until the policy stops changing.
+        On grids with little noise and discounts near 1 this takes a
+        handful of rounds where value iteration needs thousands of sweeps.
+
+        An action only replaces the policy's if it is better by more than
+        improvementTolerance, since the exact values carry rounding errors.
+        Here iterations is the largest number of rounds; afterwards
+        iterationsUsed is the number of policies evaluated and residual
+        the largest change in a state's value over the last round.
+    """
+    improvementTolerance = 1e-9
+
+    def __init__(self, mdp, discount = 0.9, iterations = 100, initialValues = None, followChanges = False):
+        ValueIterationAgent.__init__(self, mdp, discount, iterations,
+                                     initialValues = initialValues, followChanges = followChanges)
+
+    def runValueIteration(self):
+        compiled = self.compiledMDP
+        values = self.getInitialValues()
+        if self.initialValues is None:
+            policy = compiled.getProperRows()
+        else:
+            policy = compiled.getGreedyRows(values, self.discount)
+        for k in range(self.iterations):
+            newValues = self.evaluatePolicy(values, policy)
+            self.residual = max([abs(new - old) for new, old in zip(newValues, values)] + [0.0])
+            values = newValues
+            self.iterationsUsed += 1
+            newPolicy = compiled.getGreedyRows(values, self.discount, policy, self.improvementTolerance)
+            if newPolicy == policy: break
+            policy = newPolicy
+        self.policyRows = policy
+        self.setValues(values)
+
+    def computeActionFromValues(self, state):
+        """
+          Returns the action of the policy found.  Greedy actions computed
+          from the values could break ties differently, and with no
+          discount and no living reward a tie can go to an action that
+          never reaches an exit.
+        """
+        compiled = self.compiledMDP
+        i = compiled.stateIndices.get(state)
+        if i is None or self.policyRows[i] == -1:
+            return None
+        return compiled.actions[i][self.policyRows[i] - compiled.rowStart[i]]
+
+    def evaluatePolicy(self, values, policy):
+        "Returns the exact values of a policy (the last policy's values aren't needed)"
+        self.backups += len([row for row in policy if row != -1])
+        return self.compiledMDP.evaluatePolicy(self.discount, policy)
+
+class ModifiedPolicyIterationAgent(PolicyIterationAgent):
+    """
+        A ModifiedPolicyIterationAgent is a PolicyIterationAgent that
+        evaluates each policy only approximately, with evaluationSweeps
+        sweeps of the policy's Bellman equation starting from the values of
+        the last policy, instead of solving for them exactly.  It stops
+        once the policy is stable and the last sweep changed no value by
+        tolerance or more.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100, evaluationSweeps = 20, tolerance = 1e-6,
+                 initialValues = None, followChanges = False):
+        # The stopping test needs the residual of at least one sweep
+        if evaluationSweeps < 1: raise Exception('Modified policy iteration needs at least one evaluation sweep')
+        self.evaluationSweeps = evaluationSweeps
+        self.stopTolerance = tolerance
+        PolicyIterationAgent.__init__(self, mdp, discount, iterations, initialValues, followChanges)
+
+    def runValueIteration(self):
+        compiled = self.compiledMDP
+        values = self.getInitialValues()
+        policy = compiled.getGreedyRows(values, self.discount)
+        for k in range(self.iterations):
+            values = self.evaluatePolicy(values, policy)
+            self.iterationsUsed += 1
+            newPolicy = compiled.getGreedyRows(values, self.discount, policy, self.improvementTolerance)
+            if newPolicy == policy and self.residual < self.stopTolerance: break
+            policy = newPolicy
+        self.policyRows = policy
+        self.setValues(values)
+
+    def evaluatePolicy(self, values, policy):
+        statesWithActions = len([row for row in policy if row != -1])
+        for sweep in range(self.evaluationSweeps):
+            values, self.residual = self.compiledMDP.policySweep(values, self.discount, policy)
+            self.backups += statesWithActions
+        return values
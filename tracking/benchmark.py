@@ -0,0 +1,447 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Fixed-seed benchmarks of the game engine, the learning agents and the
+inference modules, for catching performance regressions.
+
+  > python benchmark.py                          run everything and print the times
+  > python benchmark.py -o baseline.json         ... and save them as a baseline
+  > python benchmark.py -c baseline.json         compare against a saved baseline
+  > python benchmark.py -b engine.*,mdp.* -r 5   run some of them, 5 times each
+
+This file is the same in the reinforcement and tracking projects.  Each
+benchmark needs the modules of one of them (the engine benchmarks need only
+the shared ones), and benchmarks whose modules are missing are skipped.
+
+Before every repeat the random generator is seeded with the same seed and the
+benchmark is set up afresh, so every repeat does exactly the same work.  Only
+the work itself is timed, not the set up.  The time reported for a benchmark
+is the best of its repeats, which is the least disturbed by whatever else the
+machine is doing; the median is saved too.  A comparison flags a benchmark
+as slower when its best time grew by more than the threshold (-t), and
+exits with status 1 if any did.
+"""
+
+import sys
+import time
+import random
+import fnmatch
+import optparse
+from game import Directions
+
+try:
+    import json
+except ImportError:
+    json = None
+
+BENCHMARKS = []
+
+def addBenchmark(name, kind, setup, number=1):
+    """
+    Registers a benchmark.  setup() prepares the work (seeded) and returns
+    a function that does it; that function is called number times per
+    repeat.  kind is 'micro' for a single operation or 'macro' for a whole
+    game or solve.
+    """
+    BENCHMARKS.append((name, kind, setup, number))
+
+##############
+# The engine #
+##############
+
+def generatedLayout():
+    "A mid-sized maze that exists in both projects"
+    import layout
+    return layout.generateLayout(41, 21, seed=1, numGhosts=3)
+
+def randomTrajectory(numStates=300):
+    """
+    The states of random play on the generated layout, each agent taking a
+    random legal action in turn.  Play starts over when a game ends.
+    """
+    import pacman
+    pacman.GameState.getAndResetExplored()
+    layout = generatedLayout()
+    initial = pacman.GameState()
+    initial.initialize(layout, layout.getNumGhosts())
+    states = []
+    state = initial
+    agentIndex = 0
+    while len(states) < numStates:
+        if state.isWin() or state.isLose():
+            state, agentIndex = initial, 0
+        states.append((state, agentIndex))
+        state = state.generateSuccessor(agentIndex, random.choice(state.getLegalActions(agentIndex)))
+        agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return states
+
+def setupGenerateSuccessor():
+    states = randomTrajectory()
+    moves = [(state, agentIndex, state.getLegalActions(agentIndex)) for state, agentIndex in states]
+    def run():
+        for state, agentIndex, actions in moves:
+            for action in actions:
+                state.generateSuccessor(agentIndex, action)
+    return run
+
+def setupDeepCopy():
+    states = [state for state, agentIndex in randomTrajectory()]
+    def run():
+        for state in states:
+            state.data.deepCopy()
+    return run
+
+def setupGridOps(gridType):
+    def setup():
+        import game
+        layout = generatedLayout()
+        grid = getattr(game, gridType)(layout.width, layout.height)
+        for x, y in layout.food.asList(): grid[x][y] = True
+        cells = [(x, y) for x in range(layout.width) for y in range(layout.height)]
+        def run():
+            copy = grid.copy()
+            for x, y in cells:
+                if copy[x][y]: copy[x][y] = False
+            for x, y in cells[::3]:
+                copy[x][y] = True
+            copy.count()
+            copy.asList()
+            copy == grid
+            hash(copy)
+        return run
+    return setup
+
+def setupClosestFood():
+    import featureExtractors
+    states = [state for state, agentIndex in randomTrajectory() if agentIndex == 0]
+    def run():
+        for state in states:
+            featureExtractors.closestFood(state.getPacmanPosition(), state.getFood(), state.getWalls())
+    return run
+
+class RandomPacman:
+    "Plays a random legal move other than stopping"
+    def __init__(self):
+        self.index = 0
+    def getAction(self, state):
+        actions = [action for action in state.getLegalPacmanActions() if action != Directions.STOP]
+        return random.choice(actions or [Directions.STOP])
+
+def setupPacmanGames():
+    import pacman, ghostAgents, textDisplay
+    layout = generatedLayout()
+    def run():
+        for gameNumber in range(10):
+            ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(layout.getNumGhosts())]
+            game = pacman.ClassicGameRules().newGame(layout, RandomPacman(), ghosts,
+                                                       textDisplay.NullGraphics(), quiet = True)
+            game.run()
+        pacman.GameState.getAndResetExplored()
+    return run
+
+addBenchmark('engine.generateSuccessor', 'micro', setupGenerateSuccessor)
+addBenchmark('engine.deepCopy', 'micro', setupDeepCopy, 10)
+addBenchmark('engine.Grid', 'micro', setupGridOps('Grid'), 20)
+addBenchmark('engine.BitGrid', 'micro', setupGridOps('BitGrid'), 20)
+addBenchmark('features.closestFood', 'micro', setupClosestFood)
+addBenchmark('engine.pacmanGames', 'macro', setupPacmanGames)
+
+#####################
+# MDPs and learning #
+#####################
+
+class NullCanvas:
+    "Stands in for the crawler's Tk canvas, so the robot can run undisplayed"
+    def winfo_reqwidth(self): return 1000
+    def winfo_reqheight(self): return 300
+    def create_rectangle(self, *args, **kwargs): return None
+    def create_polygon(self, *args, **kwargs): return None
+    def create_line(self, *args, **kwargs): return None
+
+def getGrid(name):
+    import gridworld
+    if name == 'generated': return gridworld.generateGridworld(40, 30, seed=1)
+    return getattr(gridworld, 'get' + name)()
+
+def setupValueIteration(gridName):
+    def setup():
+        import valueIterationAgents
+        mdp = getGrid(gridName)
+        mdp.setNoise(0.2)
+        def run():
+            valueIterationAgents.ValueIterationAgent(mdp, 0.9, 100)
+        return run
+    return setup
+
+def setupGridworldQLearning():
+    import gridworld, qlearningAgents
+    mdp = getGrid('BookGrid')
+    mdp.setNoise(0.2)
+    environment = gridworld.GridworldEnvironment(mdp)
+    agent = qlearningAgents.QLearningAgent(gamma = 0.9, alpha = 0.5, epsilon = 0.3,
+                                           actionFn = lambda state: mdp.getPossibleActions(state))
+    ignore = lambda *args: None
+    def run():
+        for episode in range(200):
+            gridworld.runEpisode(agent, environment, 0.9, agent.getAction, ignore, ignore, ignore, episode)
+    return run
+
+def setupCrawlerQLearning():
+    import crawler, qlearningAgents
+    environment = crawler.CrawlingRobotEnvironment(crawler.CrawlingRobot(NullCanvas()))
+    agent = qlearningAgents.QLearningAgent(actionFn = lambda state: environment.getPossibleActions(state))
+    agent.setEpsilon(0.5)
+    agent.setLearningRate(0.8)
+    agent.setDiscount(0.8)
+    agent.startEpisode()
+    def run():
+        for step in range(5000):
+            state = environment.getCurrentState()
+            action = agent.getAction(state)
+            nextState, reward = environment.doAction(action)
+            agent.observeTransition(state, action, nextState, reward)
+    return run
+
+def setupApproximateQTraining():
+    import pacman, qlearningAgents, ghostAgents, textDisplay, layout
+    smallClassic = layout.getLayout('smallClassic')
+    agent = qlearningAgents.ApproximateQAgent(extractor = 'SimpleExtractor', numTraining = 10)
+    def run():
+        for gameNumber in range(5):
+            ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(smallClassic.getNumGhosts())]
+            game = pacman.ClassicGameRules().newGame(smallClassic, agent, ghosts,
+                                                       textDisplay.NullGraphics(), quiet = True)
+            game.run()
+        pacman.GameState.getAndResetExplored()
+    return run
+
+for gridName in ['BookGrid', 'DiscountGrid', 'MazeGrid', 'generated']:
+    addBenchmark('mdp.valueIteration.' + gridName, 'macro', setupValueIteration(gridName))
+addBenchmark('learning.gridworldQLearning', 'macro', setupGridworldQLearning)
+addBenchmark('learning.crawlerQLearning', 'macro', setupCrawlerQLearning)
+addBenchmark('learning.approximateQTraining', 'macro', setupApproximateQTraining)
+
+#############
+# Inference #
+#############
+
+TRACKING_LAYOUTS = ['smallHunt', 'openHunt', 'oneHunt', 'bigHunt']
+
+def observedTrajectory(layoutName, numGhosts, numStates=10):
+    """
+    What a busters agent sees over random play on a tracking layout: the
+    states with the ghosts removed, as BustersAgent.observationFunction
+    leaves them.
+    """
+    import busters, layout, ghostAgents
+    huntLayout = layout.getLayout(layoutName)
+    ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(numGhosts)]
+    state = busters.GameState()
+    state.initialize(huntLayout, numGhosts)
+    observed = []
+    while len(observed) < numStates and not (state.isWin() or state.isLose()):
+        state = state.generateSuccessor(0, random.choice(state.getLegalPacmanActions()))
+        for ghost in ghosts:
+            if state.isWin() or state.isLose(): break
+            state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+        observation = state.deepCopy()
+        agents = observation.data.agentStates
+        observation.data.agentStates = [agents[0]] + [None for i in range(1, len(agents))]
+        observation.data.agentStatesChanged()
+        observed.append(observation)
+    return ghosts, observed
+
+def setupInference(layoutName, moduleName, numParticles=None):
+    def setup():
+        import inference
+        ghosts, observed = observedTrajectory(layoutName, 2)
+        modules = [getattr(inference, moduleName)(ghost) for ghost in ghosts]
+        for module in modules:
+            if numParticles is not None: module.setNumParticles(numParticles)
+            module.initialize(observed[0])
+        def run():
+            for state in observed:
+                for module in modules:
+                    module.elapseTime(state)
+                    module.observeState(state)
+                    module.getBeliefDistribution()
+        return run
+    return setup
+
+def setupJointInference(layoutName):
+    def setup():
+        import inference
+        ghosts, observed = observedTrajectory(layoutName, 2)
+        joint = inference.JointParticleFilter()
+        legalPositions = [p for p in observed[0].getWalls().asList(False) if p[1] > 1]
+        joint.initialize(observed[0], legalPositions)
+        for ghost in ghosts: joint.addGhostAgent(ghost)
+        def run():
+            for state in observed:
+                joint.elapseTime(state)
+                joint.observeState(state)
+                joint.getBeliefDistribution()
+        return run
+    return setup
+
+def setupComputeDistances(layoutName):
+    def setup():
+        import distanceCalculator, layout
+        huntLayout = layout.getLayout(layoutName)
+        return lambda: distanceCalculator.computeDistances(huntLayout)
+    return setup
+
+def setupBustersGame(layoutName):
+    def setup():
+        import __main__, busters, bustersAgents, ghostAgents
+        import layout as layoutModule
+        huntLayout = layoutModule.getLayout(layoutName)
+        display = bustersAgents.NullGraphics()
+        def run():
+            __main__.__dict__['_display'] = display
+            ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(2)]
+            pacman = bustersAgents.GreedyBustersAgent(0, 'ExactInference', ghosts)
+            busters.BustersGameRules().newGame(huntLayout, pacman, ghosts, display, 200).run()
+        return run
+    return setup
+
+for layoutName in TRACKING_LAYOUTS:
+    addBenchmark('inference.ExactInference.' + layoutName, 'micro',
+                 setupInference(layoutName, 'ExactInference'))
+    # Each position needs a particle for the uniform prior
+    addBenchmark('inference.ParticleFilter.' + layoutName, 'micro',
+                 setupInference(layoutName, 'ParticleFilter', 1000))
+    addBenchmark('inference.JointParticleFilter.' + layoutName, 'micro', setupJointInference(layoutName))
+    addBenchmark('distances.computeDistances.' + layoutName, 'micro', setupComputeDistances(layoutName))
+addBenchmark('tracking.bustersGame.smallHunt', 'macro', setupBustersGame('smallHunt'))
+
+##########
+# Runner #
+##########
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) / 2
+    if len(values) % 2: return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def runBenchmark(setup, number, repeat, seed):
+    """
+    Returns the time of one call of the benchmark's work in each repeat, or
+    raises ImportError if the modules it needs are missing.
+    """
+    times = []
+    for i in range(repeat):
+        random.seed(seed)
+        work = setup()
+        start = time.time()
+        for j in range(number):
+            work()
+        times.append((time.time() - start) / number)
+    return times
+
+def runBenchmarks(patterns=None, kind=None, repeat=3, seed=0, out=sys.stdout):
+    """
+    Runs the registered benchmarks whose names match one of the (fnmatch)
+    patterns and of the given kind, or all of them, and returns the results
+    keyed by name.
+    """
+    results = {}
+    missing = {}
+    for name, benchmarkKind, setup, number in BENCHMARKS:
+        if kind is not None and benchmarkKind != kind: continue
+        if patterns and not [p for p in patterns if fnmatch.fnmatch(name, p)]: continue
+        try:
+            times = runBenchmark(setup, number, repeat, seed)
+        except ImportError, e:
+            missing[str(e)] = missing.get(str(e), 0) + 1
+            continue
+        results[name] = {'kind': benchmarkKind, 'best': min(times), 'median': median(times),
+                         'repeat': repeat, 'number': number}
+        if out is not None:
+            out.write('%-45s %10.4fs   (median %.4fs)\n' % (name, min(times), median(times)))
+            out.flush()
+    if out is not None:
+        for reason in sorted(missing):
+            out.write('Skipped %d benchmarks: %s\n' % (missing[reason], reason))
+    return results
+
+def compareResults(results, baseline, threshold=0.1, out=sys.stdout):
+    """
+    Prints each benchmark's best time against the baseline's and returns the
+    names of those that got slower by more than the threshold (a fraction).
+    """
+    slower = []
+    out.write('\n%-45s %10s %10s %8s\n' % ('benchmark', 'baseline', 'now', 'ratio'))
+    for name in sorted(results):
+        if name not in baseline:
+            out.write('%-45s %10s %9.4fs\n' % (name, '-', results[name]['best']))
+            continue
+        old, new = baseline[name]['best'], results[name]['best']
+        ratio = new / old if old > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            slower.append(name)
+            flag = '  SLOWER'
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        out.write('%-45s %9.4fs %9.4fs %7.2fx%s\n' % (name, old, new, ratio, flag))
+    return slower
+
+def readOptions(argv):
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('-b', '--benchmarks', dest='benchmarks', default=None,
+                      help='Comma separated names or patterns of the benchmarks to run (default: all)')
+    parser.add_option('-k', '--kind', dest='kind', default=None, choices=['micro', 'macro'],
+                      help='Only run the micro or the macro benchmarks')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=3,
+                      help='Times to run each benchmark (default %default)')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='Random seed (default %default)')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='Write the results as JSON to this file, e.g. to save a baseline')
+    parser.add_option('-c', '--compare', dest='compare', default=None,
+                      help='Compare the results with a baseline written earlier with -o')
+    parser.add_option('-t', '--threshold', dest='threshold', type='float', default=0.1,
+                      help='Fraction by which a benchmark may slow down before it is flagged (default %default)')
+    parser.add_option('-l', '--list', action='store_true', dest='list', default=False,
+                      help='List the benchmarks and exit')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readOptions(sys.argv[1:])
+    if options.list:
+        for name, kind, setup, number in BENCHMARKS: print '%-45s %s' % (name, kind)
+        sys.exit(0)
+    if json is None: raise Exception('benchmark.py needs the json module (Python 2.6 or later)')
+
+    patterns = None
+    if options.benchmarks: patterns = options.benchmarks.split(',')
+    results = runBenchmarks(patterns, options.kind, options.repeat, options.seed)
+
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump({'python': sys.version.split()[0], 'seed': options.seed, 'benchmarks': results},
+                      f, indent=2, sort_keys=True)
+        finally: f.close()
+    if options.compare:
+        f = open(options.compare)
+        try: baseline = json.load(f)['benchmarks']
+        finally: f.close()
+        if compareResults(results, baseline, options.threshold): sys.exit(1)
@@ -123,6 +123,7 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.updateZobrist()
         p = state.getPacmanPosition()
         state.data.ghostDistances = [getNoisyDistance(p, state.getGhostPosition(i)) for i in range(1,state.getNumAgents())]
         if agentIndex == self.getNumAgents() - 1:
@@ -474,6 +475,10 @@ def readCommand( argv ):
                       help='Renders the ghosts in the display (cheating)', default=False)
     parser.add_option('-t', '--frameTime', dest='frameTime', type='float',
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=default('Number of processes to play the games in; games in workers are not displayed'), default=1)
+    parser.add_option('--profile', dest='profile', metavar='PREFIX',
+                      help='Profile the games, writing PREFIX.prof, PREFIX.txt and PREFIX.collapsed (see profiling.py); games in workers are only timed', default=None)
 
     options, otherjunk = parser.parse_args()
     if len(otherjunk) != 0:
@@ -504,6 +509,8 @@ def readCommand( argv ):
                                                                   options.showGhosts, \
                                                                   frameTime = options.frameTime)
     args['numGames'] = options.numGames
+    args['workers'] = options.workers
+    args['profile'] = options.profile
 
     return args
 
@@ -532,7 +539,7 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def runGames( layout, pacman, ghosts, display, numGames, maxMoves=-1):
+def runGames( layout, pacman, ghosts, display, numGames, maxMoves=-1, workers=1, profile=None):
     # Hack for agents writing to the display
     import __main__
     __main__.__dict__['_display'] = display
@@ -540,10 +547,22 @@ def runGames( layout, pacman, ghosts, display, numGames, maxMoves=-1):
     rules = BustersGameRules()
     games = []
 
-    for i in range( numGames ):
-        game = rules.newGame( layout, pacman, ghosts, display, maxMoves )
-        game.run()
-        games.append(game)
+    profiler = None
+    if profile:
+        import profiling
+        profiler = profiling.Profiler()
+        profiler.start()
+
+    if workers > 1 and numGames > 1:
+        games = runGamesInParallel( layout, pacman, ghosts, numGames, maxMoves, workers )
+    else:
+        for i in range( numGames ):
+            game = rules.newGame( layout, pacman, ghosts, display, maxMoves )
+            game.run()
+            games.append(game)
+
+    if profiler:
+        for game in games: profiler.addGame(game)
 
     if numGames > 1:
         scores = [game.state.getScore() for game in games]
@@ -554,8 +573,52 @@ def runGames( layout, pacman, ghosts, display, numGames, maxMoves=-1):
         print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
         print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
 
+    if profiler:
+        profiler.stop()
+        profiler.write(profile)
     return games
 
+_parallelGameArgs = None
+
+def initializeWorker( args ):
+    "Keeps the arguments of runGamesInParallel in a worker process for runSeededGame"
+    global _parallelGameArgs
+    _parallelGameArgs = args
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, maxMoves, workers ):
+    """
+    Plays numGames games over a pool of worker processes and returns
+    them in order.  Each game is seeded from the main random generator, so
+    with a fixed seed (-f) the games do not depend on the number of workers
+    above one.  (With one worker, or one game, runGames plays the games
+    here on the main random generator, so they differ.)
+    The returned games keep their moves, timings, agent names and final
+    state, but not their agents or display.
+    """
+    import multiprocessing
+    seeds = [random.randint(0, sys.maxint) for i in range(numGames)]
+    pool = multiprocessing.Pool(min(workers, numGames), initializeWorker,
+                                ((layout, pacman, ghosts, maxMoves),))
+    try:
+        return pool.map(runSeededGame, seeds, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def runSeededGame( seed ):
+    "Plays one undisplayed game in a worker process; see runGamesInParallel"
+    import __main__, bustersAgents
+    layout, pacman, ghosts, maxMoves = _parallelGameArgs
+    random.seed(seed)
+    display = bustersAgents.NullGraphics()
+    __main__.__dict__['_display'] = display
+    game = BustersGameRules().newGame( layout, pacman, ghosts, display, maxMoves )
+    game.run()
+    game.agents = []
+    game.display = None
+    game.agentOutput = []
+    return game
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -99,6 +99,7 @@ class BustersAgent:
         "Removes the ghost states from the gameState"
         agents = gameState.data.agentStates
         gameState.data.agentStates = [agents[0]] + [None for i in range(1, len(agents))]
+        gameState.data.agentStatesChanged()
         return gameState
 
     def getAction(self, gameState):
@@ -70,6 +70,7 @@ class InferenceModule:
         """
         conf = game.Configuration(ghostPosition, game.Directions.STOP)
         gameState.data.agentStates[self.index] = game.AgentState(conf, False)
+        gameState.data.agentStatesChanged()
         return gameState
 
     def observeState(self, gameState):
@@ -628,5 +629,6 @@ def setGhostPositions(gameState, ghostPositions):
     for index, pos in enumerate(ghostPositions):
         conf = game.Configuration(pos, game.Directions.STOP)
         gameState.data.agentStates[index + 1] = game.AgentState(conf, False)
+    gameState.data.agentStatesChanged()
     return gameState
 